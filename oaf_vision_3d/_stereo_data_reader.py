@@ -1,17 +1,35 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
+from enum import Enum
 from pathlib import Path
 from typing import Optional
 
 import numpy as np
 from matplotlib import pyplot as plt
-from nptyping import Float32, NDArray, Shape
+from nptyping import Float32, NDArray, Shape, UInt8
 
 from oaf_vision_3d.lens_model import CameraMatrix, LensModel
 from oaf_vision_3d.transformation_matrix import TransformationMatrix
 
 
+class ImageFormat(Enum):
+    UINT8_RGB = 0
+    UINT8_GRAYSCALE = 1
+
+
+def to_uint8(
+    image: NDArray[Shape["H, W, 3"], Float32], image_format: ImageFormat
+) -> NDArray[Shape["H, W, ..."], UInt8]:
+    match image_format:
+        case ImageFormat.UINT8_RGB:
+            return np.round(image * 255).astype(np.uint8)
+        case ImageFormat.UINT8_GRAYSCALE:
+            return np.round(image.mean(axis=-1) * 255).astype(np.uint8)
+        case _:
+            raise ValueError("Invalid image format")
+
+
 @dataclass
 class StereoData:
     image_0: NDArray[Shape["H, W, 3"], Float32]
@@ -32,6 +50,14 @@ class StereoData:
             return _parse_dataset_mobile(data_dir)
         raise NotImplementedError("Unknown dataset format.")
 
+    def uint8_images(
+        self, image_format: ImageFormat = ImageFormat.UINT8_RGB
+    ) -> tuple[NDArray[Shape["H, W, ..."], UInt8], NDArray[Shape["H, W, ..."], UInt8]]:
+        return (
+            to_uint8(self.image_0, image_format=image_format),
+            to_uint8(self.image_1, image_format=image_format),
+        )
+
 
 def _parse_dataset_custom(data_dir: Path) -> StereoData:
     image_0 = plt.imread(data_dir / "image_0.png")[..., :3]
@@ -0,0 +1,83 @@
+# %% [markdown]
+# # Bilinear Warp
+#
+# This function samples an image at non-integer pixel coordinates with bilinear
+# interpolation, e.g. to warp an image into another camera or to undistort it. It gives
+# the same result as `scipy.ndimage.map_coordinates` with `order=1`, `mode="constant"`
+# and `cval=np.nan` per channel, i.e. pixels outside `[0, W - 1] x [0, H - 1]` are NaN.
+#
+# `map_coordinates` works on a single channel, so warping an RGB image computes the
+# interpolation indices and weights three times. Here the indices and the weights are
+# computed once, and every neighbour is gathered for all channels at once with a
+# single `np.take` on the flattened image. The channels are kept as separate planes
+# while interpolating, so the weights are applied to contiguous memory. The pixels are
+# processed in chunks, so the temporary arrays stay small enough to remain in cache.
+
+# %%
+import numpy as np
+from nptyping import Float32, NDArray, Shape
+
+_CHUNK_SIZE = 1 << 15
+
+
+def _bilinear_warp_chunk(
+    channels: NDArray[Shape["C, N"], Float32],
+    shape: tuple[int, int],
+    x: NDArray[Shape["P"], Float32],
+    y: NDArray[Shape["P"], Float32],
+    warped: NDArray[Shape["C, P"], Float32],
+) -> None:
+    height, width = shape
+    is_outside = ~((x >= 0) & (x <= width - 1) & (y >= 0) & (y <= height - 1))
+    x = np.where(is_outside, 0, x).astype(np.float32, copy=False)
+    y = np.where(is_outside, 0, y).astype(np.float32, copy=False)
+
+    x_0 = np.minimum(x.astype(np.intp), max(width - 2, 0))
+    y_0 = np.minimum(y.astype(np.intp), max(height - 2, 0))
+    weight_x = x - x_0.astype(np.float32)
+    weight_y = y - y_0.astype(np.float32)
+
+    top_left = y_0 * width + x_0
+    bottom_left = top_left + (width if height > 1 else 0)
+    x_step = int(width > 1)
+
+    top = np.take(channels, top_left, axis=1, mode="clip")
+    top_right = np.take(channels, top_left + x_step, axis=1, mode="clip")
+    top_right -= top
+    top_right *= weight_x
+    top += top_right
+
+    np.take(channels, bottom_left, axis=1, out=warped, mode="clip")
+    bottom_right = np.take(channels, bottom_left + x_step, axis=1, mode="clip")
+    bottom_right -= warped
+    bottom_right *= weight_x
+    warped += bottom_right
+
+    warped -= top
+    warped *= weight_y
+    warped += top
+    warped[:, is_outside] = np.nan
+
+
+def bilinear_warp(
+    image: NDArray[Shape["H, W, ..."], Float32],
+    pixels: NDArray[Shape["*, *, 2"], Float32],
+) -> NDArray[Shape["*, *, ..."], Float32]:
+    height, width = image.shape[:2]
+    channels = np.ascontiguousarray(
+        np.moveaxis(image.reshape(height, width, -1), -1, 0), dtype=np.float32
+    ).reshape(-1, height * width)
+    x = pixels[..., 0].ravel()
+    y = pixels[..., 1].ravel()
+
+    warped = np.empty((channels.shape[0], x.shape[0]), dtype=np.float32)
+    for start in range(0, x.shape[0], _CHUNK_SIZE):
+        _bilinear_warp_chunk(
+            channels=channels,
+            shape=(height, width),
+            x=x[start : start + _CHUNK_SIZE],
+            y=y[start : start + _CHUNK_SIZE],
+            warped=warped[:, start : start + _CHUNK_SIZE],
+        )
+
+    return np.moveaxis(warped, 0, -1).reshape(*pixels.shape[:-1], *image.shape[2:])
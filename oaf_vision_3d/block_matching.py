@@ -4,74 +4,557 @@
 # This function performs block matching to estimate the depth of a pixel in a set of 2D
 # images. The process for this was discussed in more detail in the workshop
 # [6: Stereo Matching Fundamentals](../workshops/06_stereo_matching_fundamentals.ipynb).
+#
+# The cost of every disparity is aggregated over a window of `block_size` pixels. This
+# can either be done with two `convolve2d` calls per disparity, as in the workshop, or
+# with a [box filter](box_filter.py) based on summed-area tables applied to the full
+# cost volume at once. The latter does not get slower as the window grows.
+#
+# By default the full cost volume (one cost image per disparity) is kept in memory. For
+# large images and wide disparity ranges this does not fit, so in `streaming` mode the
+# costs are reduced with a [running minimum](running_minimum.py) as they are computed,
+# giving the same disparity map with memory independent of the disparity range.
+#
+# The images can be given as `uint8`, either RGB or grayscale, instead of `float32`. SAD
+# and SSD are then computed exactly in integers, and the cost volume holds the window
+# sums of the costs without dividing by the window size. It is stored in the smallest
+# unsigned type that fits the largest possible sum, e.g. `uint16` for grayscale SAD
+# with windows of up to 257 pixels and `uint32` for RGB SAD with `11 x 11` windows.
+# Up to a global scale the costs are the same, so the disparities are the same as for
+# the `float32` images. That scale is the window size times `255` for SAD and `255**2`
+# for SSD, since the image values are `255` times larger, and the penalties of
+# semi-global matching are multiplied by it, so the same parameters regularize `uint8`
+# and `float32` images equally. Every disparity compares slices of the two images directly instead
+# of making a rolled copy of the second image.
+#
+# The full cost volume is filled one disparity at a time, so besides the volume itself
+# only a few images worth of memory are used.
+#
+# Besides SAD and SSD on the image values, the [census transform](census_transform.py)
+# can be used as cost. The census signatures are computed once per image, and the
+# cost of a disparity is then the Hamming distance between the packed signatures.
+#
+# For smoother disparity maps the window aggregated cost volume can be passed through
+# [semi-global matching](semi_global_matching.py). Since SGM propagates costs along
+# paths through the whole image, it needs the full cost volume and can not be
+# combined with `streaming` or `workers`.
+#
+# Occluded pixels can be rejected with a left-right consistency check by setting
+# `left_right_threshold`. The cost of pixel `x'` in the right image at disparity `d`
+# is the cost of pixel `x' + d` in the left image, so the disparities of the right
+# view are read from the same cost volume by rolling every disparity slice back by
+# `d` (the diagonal of the volume) instead of matching the images a second time.
+# Pixels where the left disparity and the right disparity it points to differ by more
+# than the threshold are set to NaN.
+#
+# With `workers > 1` the image is split into horizontal strips that are matched in
+# parallel processes. Every strip is padded with a halo of `block_size[1] // 2` rows
+# so the aggregation window never reaches outside the data the strip was given.
+# Disparities only shift the image along the rows, and the strips span the full
+# width, so no halo is needed in the horizontal direction. The halo rows are cropped
+# away again before the strips are stitched together. The census cost looks at a
+# neighbourhood of its own, so for it the halo also includes the census window.
+#
+# When a good guess of the disparity is already known, e.g. from a lower resolution or
+# a previous frame, `block_matching_around_disparity` only evaluates a narrow band of
+# `search_radius` pixels around the guess for every pixel.
 
 
 # %%
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
 from enum import Enum
+from typing import Optional
 
 import numpy as np
-from nptyping import Float32, Int32, NDArray, Shape
+from nptyping import Float32, Int32, NDArray, Number, Shape
 from scipy.signal import convolve2d
 
-from oaf_vision_3d.poly_2_subvalue_fit import find_subvalue_poly_2
+from oaf_vision_3d.box_filter import box_filter, box_sum
+from oaf_vision_3d.census_transform import census_transform, hamming_distance
+from oaf_vision_3d.poly_2_subvalue_fit import argmin, find_subvalue_poly_2
+from oaf_vision_3d.running_minimum import RunningMinimum
+from oaf_vision_3d.semi_global_matching import (
+    SemiGlobalMatchingParameters,
+    semi_global_matching,
+)
 
 
 class CostFunction(Enum):
     SUM_OF_ABSOLUTE_DIFFERENCE = 0
     SUM_OF_SQUARED_DIFFERENCE = 1
+    CENSUS = 2
+
+
+CENSUS_WINDOW_SIZE = np.array([9, 7], dtype=np.int32)
+
+
+class Aggregation(Enum):
+    CONVOLVE_2D = 0
+    SUMMED_AREA_TABLE = 1
+
 
+def prepare_image(
+    image: NDArray[Shape["H, W, ..."], Number], cost_function: CostFunction
+) -> NDArray[Shape["H, W, ..."], Number]:
+    if cost_function is CostFunction.CENSUS:
+        return census_transform(image=image, window_size=CENSUS_WINDOW_SIZE)
+    return image[..., None] if image.ndim == 2 else image
 
-def _get_cost(
-    image_0: NDArray[Shape["H, W, ..."], Float32],
-    image_1: NDArray[Shape["H, W, ..."], Float32],
+
+def get_cost(
+    image_0: NDArray[Shape["H, W, ..."], Number],
+    image_1: NDArray[Shape["H, W, ..."], Number],
     cost_function: CostFunction,
-) -> NDArray[Shape["H, W"], Float32]:
+) -> NDArray[Shape["H, W"], Number]:
     match cost_function:
+        case CostFunction.SUM_OF_ABSOLUTE_DIFFERENCE if image_0.dtype == np.uint8:
+            difference = np.subtract(image_0, image_1, dtype=np.int16)
+            return np.abs(difference, out=difference).sum(axis=-1, dtype=np.uint16)
+        case CostFunction.SUM_OF_SQUARED_DIFFERENCE if image_0.dtype == np.uint8:
+            difference = np.subtract(image_0, image_1, dtype=np.int32)
+            return np.square(difference, out=difference).sum(axis=-1, dtype=np.uint32)
         case CostFunction.SUM_OF_ABSOLUTE_DIFFERENCE:
             return np.abs(image_0 - image_1).sum(axis=-1)
         case CostFunction.SUM_OF_SQUARED_DIFFERENCE:
             return ((image_0 - image_1) ** 2).sum(axis=-1)
+        case CostFunction.CENSUS:
+            return hamming_distance(
+                signature_0=np.asarray(image_0, dtype=np.uint64),
+                signature_1=np.asarray(image_1, dtype=np.uint64),
+            )
         case _:
             raise ValueError("Invalid cost function")
 
 
+def _get_shifted_cost(
+    image_0: NDArray[Shape["H, W, ..."], Number],
+    image_1: NDArray[Shape["H, W, ..."], Number],
+    disparity: int,
+    cost_function: CostFunction,
+) -> NDArray[Shape["H, W"], Number]:
+    width = image_1.shape[1]
+    shift = int(disparity) % width
+    inside = get_cost(image_0[:, shift:], image_1[:, : width - shift], cost_function)
+
+    cost = np.empty(image_0.shape[:2], dtype=inside.dtype)
+    cost[:, shift:] = inside
+    cost[:, :shift] = get_cost(
+        image_0[:, :shift], image_1[:, width - shift :], cost_function
+    )
+    return cost
+
+
+def _uint8_cost_scale(cost_function: CostFunction) -> Optional[int]:
+    match cost_function:
+        case CostFunction.SUM_OF_ABSOLUTE_DIFFERENCE:
+            return 255
+        case CostFunction.SUM_OF_SQUARED_DIFFERENCE:
+            return 255**2
+        case _:
+            return None
+
+
+def _window_sum_dtype(
+    image: NDArray[Shape["H, W, ..."], Number],
+    cost_function: CostFunction,
+    block_size: NDArray[Shape["[x, y]"], Int32],
+) -> Optional[type]:
+    if image.dtype != np.uint8:
+        return None
+    cost_scale = _uint8_cost_scale(cost_function=cost_function)
+    if cost_scale is None:
+        return None
+    largest_sum = cost_scale * image.shape[-1] * int(block_size[0]) * int(block_size[1])
+    if largest_sum <= np.iinfo(np.uint16).max:
+        return np.uint16
+    if largest_sum <= np.iinfo(np.uint32).max:
+        return np.uint32
+    return np.uint64
+
+
+def _aggregate_cost(
+    cost: NDArray[Shape["N, H, W"], Number],
+    block_size: NDArray[Shape["[x, y]"], Int32],
+    aggregation: Aggregation,
+) -> NDArray[Shape["N, H, W"], Float32]:
+    match aggregation:
+        case Aggregation.CONVOLVE_2D:
+            return np.array(
+                [
+                    convolve2d(
+                        convolve2d(
+                            _cost,
+                            np.ones((1, block_size[0])) / block_size[0],
+                            mode="same",
+                        ),
+                        np.ones((block_size[1], 1)) / block_size[1],
+                        mode="same",
+                    )
+                    for _cost in cost
+                ],
+                dtype=np.float32,
+            )
+        case Aggregation.SUMMED_AREA_TABLE:
+            return box_filter(values=cost, block_size=block_size)
+        case _:
+            raise ValueError("Invalid aggregation")
+
+
+def _aggregate_cost_sum(
+    cost: NDArray[Shape["N, H, W"], Number],
+    block_size: NDArray[Shape["[x, y]"], Int32],
+    aggregation: Aggregation,
+    dtype: type,
+) -> NDArray[Shape["N, H, W"], Number]:
+    match aggregation:
+        case Aggregation.CONVOLVE_2D:
+            return np.array(
+                [
+                    convolve2d(
+                        convolve2d(
+                            _cost.astype(dtype, copy=False),
+                            np.ones((1, block_size[0]), dtype=dtype),
+                            mode="same",
+                        ),
+                        np.ones((block_size[1], 1), dtype=dtype),
+                        mode="same",
+                    )
+                    for _cost in cost
+                ],
+                dtype=dtype,
+            )
+        case Aggregation.SUMMED_AREA_TABLE:
+            return box_sum(values=cost, block_size=block_size, dtype=dtype)
+        case _:
+            raise ValueError("Invalid aggregation")
+
+
+def _left_right_consistency_check(
+    disparity: NDArray[Shape["H, W"], Float32],
+    right_disparity: NDArray[Shape["H, W"], Int32],
+    threshold: float,
+) -> NDArray[Shape["H, W"], Float32]:
+    rows, columns = np.indices(disparity.shape)
+    right_columns = np.round(columns - np.nan_to_num(disparity)).astype(np.int32)
+    inconsistent = (
+        np.abs(disparity - right_disparity[rows, right_columns % disparity.shape[1]])
+        > threshold
+    )
+    disparity[inconsistent] = np.nan
+    return disparity
+
+
+def _disparity_from_cost_volume(
+    image_0: NDArray[Shape["H, W, ..."], Number],
+    image_1: NDArray[Shape["H, W, ..."], Number],
+    disparities: NDArray[Shape["N"], Int32],
+    block_size: NDArray[Shape["[x, y]"], Int32],
+    subpixel_fit: bool,
+    cost_function: CostFunction,
+    aggregation: Aggregation,
+    left_right_threshold: Optional[float] = None,
+    semi_global_matching_parameters: Optional[SemiGlobalMatchingParameters] = None,
+) -> NDArray[Shape["H, W"], Float32]:
+    window_sum_dtype = _window_sum_dtype(
+        image=image_0, cost_function=cost_function, block_size=block_size
+    )
+    disparity_error: NDArray[Shape["N, H, W"], Number] = np.empty(
+        (disparities.shape[0], *image_0.shape[:2]),
+        dtype=np.float32 if window_sum_dtype is None else window_sum_dtype,
+    )
+    for index, _disparity in enumerate(disparities):
+        single_pixel_error = _get_shifted_cost(
+            image_0, image_1, _disparity, cost_function
+        )
+        if window_sum_dtype is None:
+            disparity_error[index] = _aggregate_cost(
+                cost=single_pixel_error[None],
+                block_size=block_size,
+                aggregation=aggregation,
+            )[0]
+        else:
+            disparity_error[index] = _aggregate_cost_sum(
+                cost=single_pixel_error[None],
+                block_size=block_size,
+                aggregation=aggregation,
+                dtype=window_sum_dtype,
+            )[0]
+
+    if semi_global_matching_parameters is not None:
+        cost_scale = _uint8_cost_scale(cost_function=cost_function)
+        if window_sum_dtype is not None and cost_scale is not None:
+            cost_scale *= int(block_size[0]) * int(block_size[1])
+            semi_global_matching_parameters = replace(
+                semi_global_matching_parameters,
+                penalty_1=semi_global_matching_parameters.penalty_1 * cost_scale,
+                penalty_2=semi_global_matching_parameters.penalty_2 * cost_scale,
+            )
+        disparity_error = semi_global_matching(
+            cost_volume=disparity_error, parameters=semi_global_matching_parameters
+        )
+
+    if subpixel_fit:
+        disparity = find_subvalue_poly_2(
+            values=disparities.astype(np.float32), function_value=disparity_error
+        )
+    else:
+        disparity = disparities[argmin(disparity_error)].astype(np.float32)
+
+    if left_right_threshold is not None:
+        right_minimum = RunningMinimum(
+            number_of_values=disparities.shape[0], shape=image_0.shape[:2]
+        )
+        for index, (_disparity, _disparity_error) in enumerate(
+            zip(disparities, disparity_error)
+        ):
+            right_minimum.update(
+                index=index, value=np.roll(_disparity_error, -_disparity, axis=1)
+            )
+        disparity = _left_right_consistency_check(
+            disparity=disparity,
+            right_disparity=disparities[right_minimum.argmin()],
+            threshold=left_right_threshold,
+        )
+    return disparity
+
+
+def _disparity_from_running_minimum(
+    image_0: NDArray[Shape["H, W, ..."], Number],
+    image_1: NDArray[Shape["H, W, ..."], Number],
+    disparities: NDArray[Shape["N"], Int32],
+    block_size: NDArray[Shape["[x, y]"], Int32],
+    subpixel_fit: bool,
+    cost_function: CostFunction,
+    aggregation: Aggregation,
+    left_right_threshold: Optional[float] = None,
+) -> NDArray[Shape["H, W"], Float32]:
+    running_minimum = RunningMinimum(
+        number_of_values=disparities.shape[0], shape=image_0.shape[:2]
+    )
+    right_minimum = (
+        RunningMinimum(number_of_values=disparities.shape[0], shape=image_0.shape[:2])
+        if left_right_threshold is not None
+        else None
+    )
+    for index, _disparity in enumerate(disparities):
+        single_pixel_error = _get_shifted_cost(
+            image_0, image_1, _disparity, cost_function
+        )
+        disparity_error = _aggregate_cost(
+            cost=single_pixel_error[None],
+            block_size=block_size,
+            aggregation=aggregation,
+        )[0]
+        running_minimum.update(index=index, value=disparity_error)
+        if right_minimum is not None:
+            right_minimum.update(
+                index=index, value=np.roll(disparity_error, -_disparity, axis=1)
+            )
+
+    if subpixel_fit:
+        disparity = running_minimum.find_subvalue_poly_2(
+            values=disparities.astype(np.float32)
+        )
+    else:
+        disparity = disparities[running_minimum.argmin()].astype(np.float32)
+
+    if left_right_threshold is not None and right_minimum is not None:
+        disparity = _left_right_consistency_check(
+            disparity=disparity,
+            right_disparity=disparities[right_minimum.argmin()],
+            threshold=left_right_threshold,
+        )
+    return disparity
+
+
+def _block_matching_in_strips(
+    image_0: NDArray[Shape["H, W, ..."], Number],
+    image_1: NDArray[Shape["H, W, ..."], Number],
+    disparity_range: NDArray[Shape["2"], Float32],
+    block_size: NDArray[Shape["[x, y]"], Int32],
+    subpixel_fit: bool,
+    cost_function: CostFunction,
+    aggregation: Aggregation,
+    streaming: bool,
+    left_right_threshold: Optional[float],
+    workers: int,
+) -> NDArray[Shape["H, W"], Float32]:
+    height = image_0.shape[0]
+    halo = int(block_size[1]) // 2
+    if cost_function is CostFunction.CENSUS:
+        halo += int(CENSUS_WINDOW_SIZE[1]) // 2
+    strips = [
+        (int(rows[0]), int(rows[-1]) + 1)
+        for rows in np.array_split(np.arange(height), workers)
+        if rows.size > 0
+    ]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                block_matching,
+                image_0=image_0[max(start - halo, 0) : min(stop + halo, height)],
+                image_1=image_1[max(start - halo, 0) : min(stop + halo, height)],
+                disparity_range=disparity_range,
+                block_size=block_size,
+                subpixel_fit=subpixel_fit,
+                cost_function=cost_function,
+                aggregation=aggregation,
+                streaming=streaming,
+                left_right_threshold=left_right_threshold,
+            )
+            for start, stop in strips
+        ]
+        return np.concatenate(
+            [
+                future.result()[start - max(start - halo, 0) :][: stop - start]
+                for future, (start, stop) in zip(futures, strips)
+            ],
+            axis=0,
+        )
+
+
 def block_matching(
-    image_0: NDArray[Shape["H, W"], Float32],
-    image_1: NDArray[Shape["H, W"], Float32],
+    image_0: NDArray[Shape["H, W"], Number],
+    image_1: NDArray[Shape["H, W"], Number],
     disparity_range: NDArray[Shape["2"], Float32],
     block_size: NDArray[Shape["[x, y]"], Int32] = np.array([11, 11], dtype=np.int32),
     subpixel_fit: bool = True,
     cost_function: CostFunction = CostFunction.SUM_OF_ABSOLUTE_DIFFERENCE,
+    aggregation: Aggregation = Aggregation.CONVOLVE_2D,
+    streaming: bool = False,
+    left_right_threshold: Optional[float] = None,
+    workers: int = 1,
+    semi_global_matching_parameters: Optional[SemiGlobalMatchingParameters] = None,
 ) -> NDArray[Shape["H, W"], Float32]:
-    disparities = np.arange(disparity_range[0], disparity_range[1], dtype=np.int32)
-    error = []
-    for _disparity in disparities:
-        shifted_image_1 = np.roll(image_1, _disparity, axis=1)
-        single_pixel_error = _get_cost(image_0, shifted_image_1, cost_function)
-
-        convoluted_error = convolve2d(
-            convolve2d(
-                single_pixel_error,
-                np.ones((1, block_size[0])) / block_size[0],
-                mode="same",
-            ),
-            np.ones((block_size[1], 1)) / block_size[1],
-            mode="same",
+    if semi_global_matching_parameters is not None and (streaming or workers > 1):
+        raise ValueError(
+            "Semi-global matching needs the full cost volume of the full image"
         )
-        error.append(convoluted_error)
 
-    disparity_error = np.array(error, dtype=np.float32)
+    if workers > 1:
+        return _block_matching_in_strips(
+            image_0=image_0,
+            image_1=image_1,
+            disparity_range=disparity_range,
+            block_size=block_size,
+            subpixel_fit=subpixel_fit,
+            cost_function=cost_function,
+            aggregation=aggregation,
+            streaming=streaming,
+            left_right_threshold=left_right_threshold,
+            workers=workers,
+        )
 
-    if subpixel_fit:
-        disparity = find_subvalue_poly_2(
-            values=disparities.astype(np.float32), function_value=disparity_error
+    disparities = np.arange(disparity_range[0], disparity_range[1], dtype=np.int32)
+    image_0 = prepare_image(image=image_0, cost_function=cost_function)
+    image_1 = prepare_image(image=image_1, cost_function=cost_function)
+
+    if streaming:
+        disparity = _disparity_from_running_minimum(
+            image_0=image_0,
+            image_1=image_1,
+            disparities=disparities,
+            block_size=block_size,
+            subpixel_fit=subpixel_fit,
+            cost_function=cost_function,
+            aggregation=aggregation,
+            left_right_threshold=left_right_threshold,
         )
     else:
-        disparity = disparities[np.argmin(disparity_error, axis=0)].astype(np.float32)
+        disparity = _disparity_from_cost_volume(
+            image_0=image_0,
+            image_1=image_1,
+            disparities=disparities,
+            block_size=block_size,
+            subpixel_fit=subpixel_fit,
+            cost_function=cost_function,
+            aggregation=aggregation,
+            left_right_threshold=left_right_threshold,
+            semi_global_matching_parameters=semi_global_matching_parameters,
+        )
 
+    return _mask_invalid_disparity(disparity=disparity, disparities=disparities)
+
+
+def _mask_invalid_disparity(
+    disparity: NDArray[Shape["H, W"], Float32],
+    disparities: NDArray[Shape["N"], Int32],
+) -> NDArray[Shape["H, W"], Float32]:
     disparity[:, : int(np.abs(disparities).max())] = np.nan
     disparity[:, -int(np.abs(disparities).max()) :] = np.nan
     disparity[disparity >= disparities.max()] = np.nan
     disparity[disparity <= disparities.min()] = np.nan
 
     return disparity
+
+
+def block_matching_around_disparity_with_running_minimum(
+    image_0: NDArray[Shape["H, W"], Number],
+    image_1: NDArray[Shape["H, W"], Number],
+    disparity_range: NDArray[Shape["2"], Float32],
+    initial_disparity: NDArray[Shape["H, W"], Int32],
+    search_radius: int,
+    block_size: NDArray[Shape["[x, y]"], Int32],
+    subpixel_fit: bool,
+    cost_function: CostFunction,
+    aggregation: Aggregation,
+) -> tuple[NDArray[Shape["H, W"], Float32], RunningMinimum]:
+    disparities = np.arange(disparity_range[0], disparity_range[1], dtype=np.int32)
+    offsets = np.arange(-search_radius, search_radius + 1, dtype=np.int32)
+    image_0 = prepare_image(image=image_0, cost_function=cost_function)
+    image_1 = prepare_image(image=image_1, cost_function=cost_function)
+
+    height, width = image_0.shape[:2]
+    rows, columns = np.indices((height, width))
+    running_minimum = RunningMinimum(
+        number_of_values=offsets.shape[0], shape=(height, width)
+    )
+    for index, offset in enumerate(offsets):
+        shifted_image_1 = image_1[rows, (columns - initial_disparity - offset) % width]
+        single_pixel_error = get_cost(image_0, shifted_image_1, cost_function)
+        running_minimum.update(
+            index=index,
+            value=_aggregate_cost(
+                cost=single_pixel_error[None],
+                block_size=block_size,
+                aggregation=aggregation,
+            )[0],
+        )
+
+    if subpixel_fit:
+        offset = running_minimum.find_subvalue_poly_2(values=offsets.astype(np.float32))
+    else:
+        offset = offsets[running_minimum.argmin()].astype(np.float32)
+
+    disparity = _mask_invalid_disparity(
+        disparity=(initial_disparity + offset).astype(np.float32),
+        disparities=disparities,
+    )
+    return disparity, running_minimum
+
+
+def block_matching_around_disparity(
+    image_0: NDArray[Shape["H, W"], Number],
+    image_1: NDArray[Shape["H, W"], Number],
+    disparity_range: NDArray[Shape["2"], Float32],
+    initial_disparity: NDArray[Shape["H, W"], Int32],
+    search_radius: int = 2,
+    block_size: NDArray[Shape["[x, y]"], Int32] = np.array([11, 11], dtype=np.int32),
+    subpixel_fit: bool = True,
+    cost_function: CostFunction = CostFunction.SUM_OF_ABSOLUTE_DIFFERENCE,
+    aggregation: Aggregation = Aggregation.CONVOLVE_2D,
+) -> NDArray[Shape["H, W"], Float32]:
+    disparity, _ = block_matching_around_disparity_with_running_minimum(
+        image_0=image_0,
+        image_1=image_1,
+        disparity_range=disparity_range,
+        initial_disparity=initial_disparity,
+        search_radius=search_radius,
+        block_size=block_size,
+        subpixel_fit=subpixel_fit,
+        cost_function=cost_function,
+        aggregation=aggregation,
+    )
+    return disparity
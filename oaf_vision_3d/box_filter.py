@@ -0,0 +1,85 @@
+# %% [markdown]
+# # Box Filter
+#
+# This function computes the mean over a rectangular window around every pixel using
+# summed-area tables (running sums). The cost per pixel is a couple of additions no
+# matter how large the window is, which makes large windows as cheap as small ones.
+# It gives the same result as two `scipy.signal.convolve2d` calls with a box kernel
+# and `mode="same"`, i.e. values outside the image are treated as zero.
+#
+# The filter is applied to the last two axes, so a full `N x H x W` stack (e.g. a cost
+# volume) is filtered in one call.
+#
+# A running sum would carry a NaN on to every window after it, so NaN values are summed
+# as zero, and every window that contains one of them is set to NaN afterwards, like
+# `convolve2d` does.
+#
+# Integer values are summed exactly in integers, using `int32` running sums when the
+# largest possible sum fits and `int64` otherwise.
+#
+# `box_sum` returns the window sums without dividing by the window size, computed in
+# a given unsigned integer type. The running sums wrap around when they overflow, but
+# the difference of two of them is still exact modulo `2**bits`. So as long as the
+# window sums themselves fit, e.g. `uint16` for `11 x 11` windows of values up to
+# `541`, no wider type is ever needed.
+
+# %%
+import numpy as np
+from nptyping import Float32, Int32, NDArray, Number, Shape
+
+
+def _window_sum(
+    values: NDArray[Shape["*, ..."], Number], size: int, axis: int
+) -> NDArray[Shape["*, ..."], Number]:
+    after = (size - 1) // 2
+    before = size - 1 - after
+
+    pad_width = [(0, 0)] * values.ndim
+    pad_width[axis] = (before + 1, after)
+    cumulative_sum = np.cumsum(np.pad(values, pad_width), axis=axis, dtype=values.dtype)
+
+    length = values.shape[axis]
+    upper = [slice(None)] * values.ndim
+    lower = [slice(None)] * values.ndim
+    upper[axis] = slice(size, size + length)
+    lower[axis] = slice(0, length)
+    return cumulative_sum[tuple(upper)] - cumulative_sum[tuple(lower)]
+
+
+def box_sum(
+    values: NDArray[Shape["*, *, ..."], Number],
+    block_size: NDArray[Shape["[x, y]"], Int32],
+    dtype: type,
+) -> NDArray[Shape["*, *, ..."], Number]:
+    return _window_sum(
+        _window_sum(values.astype(dtype, copy=False), size=int(block_size[0]), axis=-1),
+        size=int(block_size[1]),
+        axis=-2,
+    )
+
+
+def box_filter(
+    values: NDArray[Shape["*, *, ..."], Number],
+    block_size: NDArray[Shape["[x, y]"], Int32],
+) -> NDArray[Shape["*, *, ..."], Float32]:
+    accumulator_dtype: type = np.float64
+    if np.issubdtype(values.dtype, np.integer):
+        largest_value = max(int(values.max(initial=0)), -int(values.min(initial=0)))
+        largest_sum = largest_value * max(
+            values.shape[-1] + int(block_size[0]),
+            int(block_size[0]) * (values.shape[-2] + int(block_size[1])),
+        )
+        accumulator_dtype = (
+            np.int32 if largest_sum <= np.iinfo(np.int32).max else np.int64
+        )
+    is_nan = np.isnan(values) if np.issubdtype(values.dtype, np.floating) else None
+    if is_nan is not None and is_nan.any():
+        values = np.where(is_nan, 0.0, values)
+    else:
+        is_nan = None
+
+    window_sum = box_sum(values=values, block_size=block_size, dtype=accumulator_dtype)
+    mean = (window_sum / (int(block_size[0]) * int(block_size[1]))).astype(np.float32)
+    if is_nan is not None:
+        mean[box_sum(values=is_nan, block_size=block_size, dtype=np.int32) > 0] = np.nan
+    return mean
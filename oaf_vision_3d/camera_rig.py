@@ -0,0 +1,323 @@
+# %% [markdown]
+# # Camera Rig
+#
+# A rig of several cameras is usually described by one [`LensModel`](lens_model.py)
+# and one [`TransformationMatrix`](transformation_matrix.py) per camera. This class
+# instead stores the parameters of all cameras as stacked arrays:
+# - `camera_matrices` holds `fx, fy, cx, cy` per camera,
+# - `distortion_coefficients` holds the 14 coefficients per camera in OpenCV order,
+# - `rotations` and `translations` hold the pose of every camera in the rig frame,
+#   i.e. they map camera coordinates to rig coordinates.
+#
+# Normalizing, denormalizing, distorting and the rigid transformations are then done
+# for all cameras in one operation on `N x H x W x 2` arrays, with the coefficients
+# broadcast over the camera axis. Unlike a single lens model, the distortion evaluates
+# every term, also those whose coefficients are zero, and the tilt is only skipped if
+# no camera is tilted. Undistortion uses the same fixed-point loop as the lens model.
+# Both work through chunks of rows of about `_CHUNK_SIZE` pixels over all cameras, so
+# the temporaries stay small. The whole rig is saved
+# to and loaded from a single `.npz` file, and the individual lens models and
+# transformations can be taken out of it again, e.g. for
+# [plane sweeping](plane_sweeping.py).
+
+# %%
+from __future__ import annotations
+
+import math
+from collections.abc import Iterator
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from nptyping import Float32, Float64, NDArray, Shape
+from scipy.spatial.transform import Rotation
+
+from oaf_vision_3d.lens_model import (
+    CameraMatrix,
+    DistortionCoefficients,
+    LensModel,
+    tilt_matrix,
+)
+from oaf_vision_3d.transformation_matrix import TransformationMatrix
+
+_DISTORTION_COEFFICIENT_NAMES = [
+    "k1",
+    "k2",
+    "p1",
+    "p2",
+    "k3",
+    "k4",
+    "k5",
+    "k6",
+    "s1",
+    "s2",
+    "s3",
+    "s4",
+    "tau_x",
+    "tau_y",
+]
+_CHUNK_SIZE = 1 << 16
+_NUMBER_OF_UNDISTORTION_ITERATIONS = 10
+
+
+def _row_chunks(shape: tuple[int, ...]) -> Iterator[slice]:
+    rows = max(1, _CHUNK_SIZE // max(1, shape[0] * math.prod(shape[2:-1])))
+    for start in range(0, shape[1], rows):
+        yield slice(start, start + rows)
+
+
+def _distort_pixel_rows(
+    normalized_pixels: NDArray[Shape["N, R, W, 2"], Float32],
+    distortion_coefficients: NDArray[Shape["14, N, 1, 1"], Float32],
+    tilt_matrices: Optional[NDArray[Shape["3, 3, N, 1, 1"], Float32]],
+    out: NDArray[Shape["N, R, W, 2"], Float32],
+) -> None:
+    k1, k2, p1, p2, k3, k4, k5, k6, s1, s2, s3, s4 = distortion_coefficients[:12]
+    x = normalized_pixels[..., 0]
+    y = normalized_pixels[..., 1]
+    if np.shares_memory(out, normalized_pixels):
+        x = x.copy()
+        y = y.copy()
+
+    r2 = x * x + y * y
+    radial = (1.0 + r2 * (k1 + r2 * (k2 + r2 * k3))) / (
+        1.0 + r2 * (k4 + r2 * (k5 + r2 * k6))
+    )
+    cross = 2.0 * x * y
+    out[..., 0] = (
+        x * radial + p1 * cross + p2 * (r2 + 2.0 * x * x) + r2 * (s1 + r2 * s2)
+    )
+    out[..., 1] = (
+        y * radial + p2 * cross + p1 * (r2 + 2.0 * y * y) + r2 * (s3 + r2 * s4)
+    )
+
+    if tilt_matrices is not None:
+        x, y = out[..., 0].copy(), out[..., 1].copy()
+        inverse_z = 1.0 / (
+            tilt_matrices[2, 0] * x + tilt_matrices[2, 1] * y + tilt_matrices[2, 2]
+        )
+        out[..., 0] = (
+            tilt_matrices[0, 0] * x + tilt_matrices[0, 1] * y + tilt_matrices[0, 2]
+        ) * inverse_z
+        out[..., 1] = (
+            tilt_matrices[1, 0] * x + tilt_matrices[1, 1] * y + tilt_matrices[1, 2]
+        ) * inverse_z
+
+
+@dataclass
+class CameraRig:
+    camera_matrices: NDArray[Shape["N, 4"], Float64]
+    distortion_coefficients: NDArray[Shape["N, 14"], Float64]
+    rotations: NDArray[Shape["N, 3, 3"], Float64]
+    translations: NDArray[Shape["N, 3"], Float64]
+
+    @staticmethod
+    def from_cameras(
+        lens_models: list[LensModel],
+        transformation_matrices: list[TransformationMatrix],
+    ) -> CameraRig:
+        if len(lens_models) != len(transformation_matrices):
+            raise ValueError("Expected one transformation matrix per lens model")
+        return CameraRig(
+            camera_matrices=np.array(
+                [
+                    [
+                        lens_model.camera_matrix.fx,
+                        lens_model.camera_matrix.fy,
+                        lens_model.camera_matrix.cx,
+                        lens_model.camera_matrix.cy,
+                    ]
+                    for lens_model in lens_models
+                ],
+                dtype=np.float64,
+            ).reshape(-1, 4),
+            distortion_coefficients=np.array(
+                [
+                    [
+                        getattr(lens_model.distortion_coefficients, name)
+                        for name in _DISTORTION_COEFFICIENT_NAMES
+                    ]
+                    for lens_model in lens_models
+                ],
+                dtype=np.float64,
+            ).reshape(-1, 14),
+            rotations=np.array(
+                [
+                    transformation_matrix.rotation.as_matrix()
+                    for transformation_matrix in transformation_matrices
+                ],
+                dtype=np.float64,
+            ).reshape(-1, 3, 3),
+            translations=np.array(
+                [
+                    transformation_matrix.translation
+                    for transformation_matrix in transformation_matrices
+                ],
+                dtype=np.float64,
+            ).reshape(-1, 3),
+        )
+
+    def __len__(self) -> int:
+        return self.camera_matrices.shape[0]
+
+    def lens_model(self, index: int) -> LensModel:
+        fx, fy, cx, cy = self.camera_matrices[index].tolist()
+        return LensModel(
+            camera_matrix=CameraMatrix(fx=fx, fy=fy, cx=cx, cy=cy),
+            distortion_coefficients=DistortionCoefficients(
+                **dict(
+                    zip(
+                        _DISTORTION_COEFFICIENT_NAMES,
+                        self.distortion_coefficients[index].tolist(),
+                    )
+                )
+            ),
+        )
+
+    def lens_models(self) -> list[LensModel]:
+        return [self.lens_model(index) for index in range(len(self))]
+
+    def transformation_matrix(
+        self, index: int, reference: Optional[int] = None
+    ) -> TransformationMatrix:
+        rotation = self.rotations[index]
+        translation = self.translations[index]
+        if reference is not None:
+            rotation = self.rotations[reference].T @ rotation
+            translation = self.rotations[reference].T @ (
+                translation - self.translations[reference]
+            )
+        return TransformationMatrix(
+            rotation=Rotation.from_matrix(rotation), translation=translation
+        )
+
+    def transformation_matrices(
+        self, reference: Optional[int] = None
+    ) -> list[TransformationMatrix]:
+        return [
+            self.transformation_matrix(index, reference=reference)
+            for index in range(len(self))
+        ]
+
+    def normalize_pixels(
+        self,
+        pixels: NDArray[Shape["N, H, W, 2"], Float32],
+        out: Optional[NDArray[Shape["N, H, W, 2"], Float32]] = None,
+    ) -> NDArray[Shape["N, H, W, 2"], Float32]:
+        out = np.subtract(
+            pixels, self.camera_matrices[:, None, None, 2:].astype(np.float32), out=out
+        )
+        return np.divide(
+            out, self.camera_matrices[:, None, None, :2].astype(np.float32), out=out
+        )
+
+    def denormalize_pixels(
+        self,
+        pixels: NDArray[Shape["N, H, W, 2"], Float32],
+        out: Optional[NDArray[Shape["N, H, W, 2"], Float32]] = None,
+    ) -> NDArray[Shape["N, H, W, 2"], Float32]:
+        out = np.multiply(
+            pixels, self.camera_matrices[:, None, None, :2].astype(np.float32), out=out
+        )
+        return np.add(
+            out, self.camera_matrices[:, None, None, 2:].astype(np.float32), out=out
+        )
+
+    def _stacked_distortion_coefficients(
+        self,
+    ) -> tuple[
+        NDArray[Shape["14, N, 1, 1"], Float32],
+        Optional[NDArray[Shape["3, 3, N, 1, 1"], Float32]],
+    ]:
+        distortion_coefficients = self.distortion_coefficients.T.astype(np.float32)[
+            ..., None, None
+        ]
+        if not self.distortion_coefficients[:, 12:].any():
+            return distortion_coefficients, None
+        tilt_matrices = np.array(
+            [
+                tilt_matrix(tau_x=tau_x, tau_y=tau_y)
+                for tau_x, tau_y in self.distortion_coefficients[:, 12:].tolist()
+            ],
+            dtype=np.float32,
+        ).reshape(-1, 3, 3)
+        return (
+            distortion_coefficients,
+            np.moveaxis(tilt_matrices, 0, -1)[..., None, None],
+        )
+
+    def distort_pixels(
+        self,
+        normalized_pixels: NDArray[Shape["N, H, W, 2"], Float32],
+        out: Optional[NDArray[Shape["N, H, W, 2"], Float32]] = None,
+    ) -> NDArray[Shape["N, H, W, 2"], Float32]:
+        if out is None:
+            out = np.empty_like(normalized_pixels)
+        distortion_coefficients, tilt_matrices = self._stacked_distortion_coefficients()
+        for rows in _row_chunks(normalized_pixels.shape):
+            _distort_pixel_rows(
+                normalized_pixels=normalized_pixels[:, rows],
+                distortion_coefficients=distortion_coefficients,
+                tilt_matrices=tilt_matrices,
+                out=out[:, rows],
+            )
+        return out
+
+    def undistort_pixels(
+        self,
+        normalized_pixels: NDArray[Shape["N, H, W, 2"], Float32],
+        out: Optional[NDArray[Shape["N, H, W, 2"], Float32]] = None,
+    ) -> NDArray[Shape["N, H, W, 2"], Float32]:
+        if out is None:
+            out = np.empty_like(normalized_pixels)
+        distortion_coefficients, tilt_matrices = self._stacked_distortion_coefficients()
+        for rows in _row_chunks(normalized_pixels.shape):
+            pixels = normalized_pixels[:, rows]
+            undistorted_normalized_pixels = out[:, rows]
+            if np.shares_memory(undistorted_normalized_pixels, pixels):
+                pixels = pixels.copy()
+            undistorted_normalized_pixels[...] = pixels
+
+            scratch = np.empty_like(pixels)
+            for _ in range(_NUMBER_OF_UNDISTORTION_ITERATIONS):
+                _distort_pixel_rows(
+                    normalized_pixels=undistorted_normalized_pixels,
+                    distortion_coefficients=distortion_coefficients,
+                    tilt_matrices=tilt_matrices,
+                    out=scratch,
+                )
+                np.subtract(pixels, scratch, out=scratch)
+                undistorted_normalized_pixels += scratch
+        return out
+
+    def project_points(
+        self, points: NDArray[Shape["P, 3"], Float32]
+    ) -> NDArray[Shape["N, P, 2"], Float32]:
+        camera_points = np.einsum(
+            "nji,npj->npi",
+            self.rotations,
+            points[None, :, :] - self.translations[:, None, :],
+        ).astype(np.float32)
+        pixels = (camera_points[..., :2] / camera_points[..., 2:])[:, None]
+        self.distort_pixels(normalized_pixels=pixels, out=pixels)
+        return self.denormalize_pixels(pixels=pixels, out=pixels)[:, 0]
+
+    def save(self, file_path: Path) -> None:
+        np.savez(
+            file_path,
+            camera_matrices=self.camera_matrices,
+            distortion_coefficients=self.distortion_coefficients,
+            rotations=self.rotations,
+            translations=self.translations,
+        )
+
+    @staticmethod
+    def load(file_path: Path) -> CameraRig:
+        data = np.load(file_path)
+        return CameraRig(
+            camera_matrices=data["camera_matrices"],
+            distortion_coefficients=data["distortion_coefficients"],
+            rotations=data["rotations"],
+            translations=data["translations"],
+        )
@@ -0,0 +1,60 @@
+# %% [markdown]
+# # Census Transform
+#
+# The census transform describes every pixel by which of its neighbours are darker
+# than itself. Each comparison is one bit, and the bits are packed into `uint64` words,
+# so a `9 x 7` window (62 neighbours) fits in a single word per pixel. Two pixels are
+# compared by counting the bits that differ (the Hamming distance), which is a XOR and
+# a popcount. Since only the ordering of the intensities is used, the cost is robust
+# to exposure and gain differences between cameras.
+
+# %%
+import numpy as np
+from nptyping import Float32, Int32, NDArray, Number, Shape, UInt64
+
+_M1 = np.uint64(0x5555555555555555)
+_M2 = np.uint64(0x3333333333333333)
+_M4 = np.uint64(0x0F0F0F0F0F0F0F0F)
+_H01 = np.uint64(0x0101010101010101)
+
+
+def census_transform(
+    image: NDArray[Shape["H, W, ..."], Number],
+    window_size: NDArray[Shape["[x, y]"], Int32] = np.array([9, 7], dtype=np.int32),
+) -> NDArray[Shape["H, W, K"], UInt64]:
+    intensity = image.mean(axis=-1) if image.ndim == 3 else image
+    height, width = intensity.shape
+    radius_x, radius_y = int(window_size[0]) // 2, int(window_size[1]) // 2
+    padded = np.pad(
+        intensity, ((radius_y, radius_y), (radius_x, radius_x)), mode="edge"
+    )
+
+    offsets = [
+        (dy, dx)
+        for dy in range(2 * radius_y + 1)
+        for dx in range(2 * radius_x + 1)
+        if (dy, dx) != (radius_y, radius_x)
+    ]
+    signature = np.zeros((height, width, (len(offsets) + 63) // 64), dtype=np.uint64)
+    for bit, (dy, dx) in enumerate(offsets):
+        is_darker = padded[dy : dy + height, dx : dx + width] < intensity
+        signature[..., bit // 64] |= is_darker.astype(np.uint64) << np.uint64(bit % 64)
+    return signature
+
+
+def _popcount(
+    values: NDArray[Shape["*, ..."], UInt64],
+) -> NDArray[Shape["*, ..."], UInt64]:
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    values = values - ((values >> np.uint64(1)) & _M1)
+    values = (values & _M2) + ((values >> np.uint64(2)) & _M2)
+    values = (values + (values >> np.uint64(4))) & _M4
+    return (values * _H01) >> np.uint64(56)
+
+
+def hamming_distance(
+    signature_0: NDArray[Shape["H, W, K"], UInt64],
+    signature_1: NDArray[Shape["H, W, K"], UInt64],
+) -> NDArray[Shape["H, W"], Float32]:
+    return _popcount(signature_0 ^ signature_1).sum(axis=-1, dtype=np.float32)
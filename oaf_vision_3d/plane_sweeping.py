@@ -4,19 +4,133 @@
 # This function performs plane sweeping to estimate the depth of a pixel in a set of 2D
 # images. The process for this was discussed in more detail in the workshop
 # [7: Stereo Matching Fundamentals Continues](../workshops/07_stereo_matching_fundamentals_continued.ipynb).
+#
+# For every depth the secondary images are warped into the main camera with a
+# [bilinear warp](bilinear_warp.py), and the sum of absolute differences to the main
+# image is aggregated over a `block_size` window with a [box filter](box_filter.py).
+# The depth with the lowest summed cost
+# over all secondary images is selected per pixel.
+# The costs are reduced with a [running minimum](running_minimum.py) as the depths are
+# swept, so only the best depth and the costs around it are kept per pixel, and the
+# memory does not grow with the number of depths.
+#
+# With `workers > 1` the depths are split into consecutive chunks that are swept in a
+# thread pool. The gathers, the arithmetic and the running sums of the box filter
+# are all NumPy operations that release the GIL, so the chunks run in parallel. Every chunk
+# only lets its own depths become the minimum, but also evaluates the depth on either
+# side of the chunk so the costs around the minimum are complete. The running minima
+# are merged in depth order, so the result is the same as for a single worker.
+#
+# Two engines are available for the warp:
+# - `REPROJECTION` scales the camera vectors by the depth and projects the resulting 3D
+#   points into the secondary camera, as in the workshop.
+# - `HOMOGRAPHY` uses that a fronto-parallel plane at depth $Z$ maps the camera vector
+#   $v = (x, y, 1)$ of the main camera to $H_Z v = R v + t / Z$ in the secondary
+#   camera, where $R$ and $t$ map main camera coordinates to secondary camera
+#   coordinates. $R v$ is computed once per secondary camera, so every depth only adds
+#   a translation and divides by $z$ before the image is sampled.
+#
+# `REPROJECTION` is the default. The two engines round differently in `float32`, so
+# where two depths have almost the same cost the engines can pick different depths,
+# also when the homography is computed in `float64`. `HOMOGRAPHY` is faster, but does
+# not reproduce the workshop exactly.
+#
+# The depths are sampled uniformly with `step_size` by default. The disparity between
+# two planes shrinks with the square of the depth, so far planes are closer together
+# in the images than near ones. With `DepthSampling.INVERSE_DEPTH` the planes are
+# instead spaced uniformly in inverse depth, with the spacing `step_size` gives at the
+# near end of the range, so every step moves the image by the same amount and fewer
+# planes cover the same range. The subpixel fit gives an offset in planes, so the
+# depth is interpolated between the planes in the space they are uniform in, i.e. in
+# inverse depth for `DepthSampling.INVERSE_DEPTH`.
+#
+# With `coarse_to_fine_factor > 1` only every `coarse_to_fine_factor`-th plane is swept
+# first. Each pixel then sweeps a band of `coarse_to_fine_factor` planes to either side
+# of its coarse minimum, where the depth of the band varies per pixel. As long as the
+# coarse minimum is close to the true one, this gives the same depth as sweeping all
+# planes at a fraction of the cost.
+#
+# The same refinement can run over `coarse_to_fine_rounds` rounds, with strides of
+# `coarse_to_fine_factor` to the power of `coarse_to_fine_rounds - 1` down to 1, each
+# round sweeping a band around the minimum of the round before. Every round gives a
+# complete depth map, which is passed to `progress_callback`. With a `time_budget` in
+# seconds, or a `cancel_event` that is set, the sweep stops before the next depth, and
+# the depth map of the last finished round is returned. The first round always
+# finishes, so there is always a result. Without coarse-to-fine there is only that
+# one round, so a `time_budget` or `cancel_event` could never take effect, and
+# passing one raises a `ValueError`.
+#
+# Summing the costs of all secondary images fails where a pixel is occluded in one of
+# them. With `best_k` the window aggregated cost of every secondary image is kept for
+# the current depth, and only the `best_k` lowest of them are summed per pixel. They
+# are found with `np.partition` over the views, which sorts NaN last, so views that do
+# not see the pixel at all are skipped as well. Only the costs of the current depth
+# are kept, so the memory grows with the number of views but not with the number of
+# depths.
+#
+# A rig that never moves does not need to redo any of this geometry. A
+# `PlaneSweepingRig` holds the camera vectors of the main camera, the inverse
+# transformations and the rotated camera vectors of every secondary camera. With
+# `cache_warps` it also keeps the pixel coordinates of every warp it has computed, so
+# repeated sweeps over the same depths only sample the images. The rig is keyed by the
+# lens models, the transformations and the image size, so it is rejected if it is
+# passed along with other cameras, and it can be saved to and loaded from a `.npz`
+# file.
+#
+# The cameras can also be given as a [`CameraRig`](camera_rig.py) with
+# `plane_sweeping_with_camera_rig`, which takes one image per camera and sweeps from
+# `reference_camera` using all others as secondary cameras.
 
 
 # %%
+from __future__ import annotations
+
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from enum import Enum
+from pathlib import Path
+from threading import Event
+from typing import Callable, Optional
 
 import numpy as np
-from nptyping import Float32, NDArray, Shape
-from scipy.ndimage import map_coordinates
+from nptyping import Float32, Int32, NDArray, Shape
 
+from oaf_vision_3d.bilinear_warp import bilinear_warp
+from oaf_vision_3d.box_filter import box_filter
+from oaf_vision_3d.camera_rig import CameraRig
 from oaf_vision_3d.lens_model import LensModel
 from oaf_vision_3d.project_points import project_points
+from oaf_vision_3d.running_minimum import RunningMinimum
 from oaf_vision_3d.transformation_matrix import TransformationMatrix
 
 
+class PlaneSweepingEngine(Enum):
+    REPROJECTION = 0
+    HOMOGRAPHY = 1
+
+
+class DepthSampling(Enum):
+    UNIFORM = 0
+    INVERSE_DEPTH = 1
+
+
+def _reprojected_pixels_at_depth(
+    camera_vectors: NDArray[Shape["H, W, 3"], Float32],
+    depth: float | NDArray[Shape["H, W"], Float32],
+    lens_model: LensModel,
+    inverse_transformation_matrix: TransformationMatrix,
+) -> NDArray[Shape["H, W, 2"], Float32]:
+    xyz = camera_vectors * np.asarray(depth, dtype=np.float32)[..., None]
+
+    return project_points(
+        points=xyz.reshape(-1, 3),
+        lens_model=lens_model,
+        transformation_matrix=inverse_transformation_matrix,
+    ).reshape(*camera_vectors.shape[:2], 2)
+
+
 def repeoject_image_at_depth(
     image: NDArray[Shape["H, W, ..."], Float32],
     camera_vectors: NDArray[Shape["H, W, 3"], Float32],
@@ -24,31 +138,482 @@ def repeoject_image_at_depth(
     lens_model: LensModel,
     transformation_matrix: TransformationMatrix,
 ) -> NDArray[Shape["H, W, ..."], Float32]:
-    xyz = camera_vectors * depth
-
-    projected_points = project_points(
-        points=xyz.reshape(-1, 3),
+    projected_points = _reprojected_pixels_at_depth(
+        camera_vectors=camera_vectors,
+        depth=depth,
         lens_model=lens_model,
-        transformation_matrix=transformation_matrix.inverse(),
-    ).reshape(*camera_vectors.shape[:2], 2)
+        inverse_transformation_matrix=transformation_matrix.inverse(),
+    )
+    return bilinear_warp(image=image, pixels=projected_points)
+
+
+@dataclass
+class PlaneInducedHomography:
+    rotated_camera_vectors: NDArray[Shape["H, W, 3"], Float32]
+    translation: NDArray[Shape["3"], Float32]
+
+    @staticmethod
+    def from_camera_vectors(
+        camera_vectors: NDArray[Shape["H, W, 3"], Float32],
+        transformation_matrix: TransformationMatrix,
+    ) -> PlaneInducedHomography:
+        inverse_transformation_matrix = transformation_matrix.inverse()
+        return PlaneInducedHomography(
+            rotated_camera_vectors=inverse_transformation_matrix.rotate(
+                points=camera_vectors
+            ).astype(np.float32),
+            translation=inverse_transformation_matrix.translation.astype(np.float32),
+        )
+
+    def normalized_pixels_at_depth(
+        self, depth: float | NDArray[Shape["H, W"], Float32]
+    ) -> NDArray[Shape["H, W, 2"], Float32]:
+        points = (
+            self.rotated_camera_vectors
+            + self.translation / np.asarray(depth, dtype=np.float32)[..., None]
+        )
+        return points[..., :2] / points[..., 2:]
 
-    return np.stack(
-        [
-            map_coordinates(
-                input=_image,
-                coordinates=[projected_points[..., 1], projected_points[..., 0]],
-                order=1,
-                mode="constant",
-                cval=np.nan,
+    def pixels_at_depth(
+        self, depth: float | NDArray[Shape["H, W"], Float32], lens_model: LensModel
+    ) -> NDArray[Shape["H, W, 2"], Float32]:
+        return lens_model.denormalize_pixels(
+            pixels=lens_model.distort_pixels(
+                normalized_pixels=self.normalized_pixels_at_depth(depth=depth)
             )
-            for _image in image.transpose(2, 0, 1)
-        ],
-        axis=-1,
-        dtype=np.float32,
+        )
+
+
+def warp_image_at_depth(
+    image: NDArray[Shape["H, W, ..."], Float32],
+    homography: PlaneInducedHomography,
+    depth: float,
+    lens_model: LensModel,
+) -> NDArray[Shape["H, W, ..."], Float32]:
+    return bilinear_warp(
+        image=image,
+        pixels=homography.pixels_at_depth(depth=depth, lens_model=lens_model),
+    )
+
+
+def _camera_vectors(
+    lens_model: LensModel, shape: tuple[int, int]
+) -> NDArray[Shape["H, W, 3"], Float32]:
+    pixels = np.indices(shape, dtype=np.float32)[::-1].transpose((1, 2, 0))
+    undistorted_normalized_pixels = lens_model.undistort_pixels(
+        normalized_pixels=lens_model.normalize_pixels(pixels=pixels)
+    )
+    return np.pad(
+        undistorted_normalized_pixels, ((0, 0), (0, 0), (0, 1)), constant_values=1.0
+    )
+
+
+def _secondary_cameras(camera_rig: CameraRig, reference_camera: int) -> list[int]:
+    return [index for index in range(len(camera_rig)) if index != reference_camera]
+
+
+def _rig_key(
+    lens_model: LensModel,
+    secondary_lens_models: list[LensModel],
+    secondary_transformation_matrices: list[TransformationMatrix],
+    shape: tuple[int, int],
+) -> str:
+    return json.dumps(
+        {
+            "lens_model": lens_model.to_dict(),
+            "secondary_lens_models": [
+                _lens_model.to_dict() for _lens_model in secondary_lens_models
+            ],
+            "secondary_transformation_matrices": [
+                _transformation_matrix.to_dict()
+                for _transformation_matrix in secondary_transformation_matrices
+            ],
+            "shape": [int(size) for size in shape],
+        },
+        sort_keys=True,
+    )
+
+
+@dataclass
+class PlaneSweepingRig:
+    key: str
+    lens_model: LensModel
+    secondary_lens_models: list[LensModel]
+    inverse_transformation_matrices: list[TransformationMatrix]
+    camera_vectors: NDArray[Shape["H, W, 3"], Float32]
+    homographies: list[PlaneInducedHomography]
+    cache_warps: bool = False
+    warps: dict[tuple[int, int, float], NDArray[Shape["H, W, 2"], Float32]] = field(
+        default_factory=dict
+    )
+
+    @staticmethod
+    def from_cameras(
+        lens_model: LensModel,
+        secondary_lens_models: list[LensModel],
+        secondary_transformation_matrices: list[TransformationMatrix],
+        shape: tuple[int, int],
+        cache_warps: bool = False,
+    ) -> PlaneSweepingRig:
+        camera_vectors = _camera_vectors(lens_model=lens_model, shape=shape)
+        return PlaneSweepingRig(
+            key=_rig_key(
+                lens_model=lens_model,
+                secondary_lens_models=secondary_lens_models,
+                secondary_transformation_matrices=secondary_transformation_matrices,
+                shape=shape,
+            ),
+            lens_model=lens_model,
+            secondary_lens_models=secondary_lens_models,
+            inverse_transformation_matrices=[
+                transformation_matrix.inverse()
+                for transformation_matrix in secondary_transformation_matrices
+            ],
+            camera_vectors=camera_vectors,
+            homographies=[
+                PlaneInducedHomography.from_camera_vectors(
+                    camera_vectors=camera_vectors,
+                    transformation_matrix=transformation_matrix,
+                )
+                for transformation_matrix in secondary_transformation_matrices
+            ],
+            cache_warps=cache_warps,
+        )
+
+    @staticmethod
+    def from_camera_rig(
+        camera_rig: CameraRig,
+        shape: tuple[int, int],
+        reference_camera: int = 0,
+        cache_warps: bool = False,
+    ) -> PlaneSweepingRig:
+        secondary_cameras = _secondary_cameras(
+            camera_rig=camera_rig, reference_camera=reference_camera
+        )
+        return PlaneSweepingRig.from_cameras(
+            lens_model=camera_rig.lens_model(reference_camera),
+            secondary_lens_models=[
+                camera_rig.lens_model(index) for index in secondary_cameras
+            ],
+            secondary_transformation_matrices=[
+                camera_rig.transformation_matrix(index, reference=reference_camera)
+                for index in secondary_cameras
+            ],
+            shape=shape,
+            cache_warps=cache_warps,
+        )
+
+    def matches(
+        self,
+        lens_model: LensModel,
+        secondary_lens_models: list[LensModel],
+        secondary_transformation_matrices: list[TransformationMatrix],
+        shape: tuple[int, int],
+    ) -> bool:
+        return self.key == _rig_key(
+            lens_model=lens_model,
+            secondary_lens_models=secondary_lens_models,
+            secondary_transformation_matrices=secondary_transformation_matrices,
+            shape=shape,
+        )
+
+    def pixels_at_depth(
+        self,
+        view: int,
+        depth: float | NDArray[Shape["H, W"], Float32],
+        engine: PlaneSweepingEngine,
+    ) -> NDArray[Shape["H, W, 2"], Float32]:
+        is_plane = np.ndim(depth) == 0
+        key = (engine.value, view, float(depth) if is_plane else np.nan)
+        if is_plane and key in self.warps:
+            return self.warps[key]
+
+        match engine:
+            case PlaneSweepingEngine.REPROJECTION:
+                pixels = _reprojected_pixels_at_depth(
+                    camera_vectors=self.camera_vectors,
+                    depth=depth,
+                    lens_model=self.secondary_lens_models[view],
+                    inverse_transformation_matrix=(
+                        self.inverse_transformation_matrices[view]
+                    ),
+                )
+            case PlaneSweepingEngine.HOMOGRAPHY:
+                pixels = self.homographies[view].pixels_at_depth(
+                    depth=depth, lens_model=self.secondary_lens_models[view]
+                )
+            case _:
+                raise ValueError("Invalid plane sweeping engine")
+
+        if self.cache_warps and is_plane:
+            self.warps[key] = pixels
+        return pixels
+
+    def save(self, file_path: Path) -> None:
+        warp_keys = list(self.warps)
+        np.savez(
+            file_path,
+            key=np.array(self.key),
+            lens_models=np.array(
+                [
+                    json.dumps(_lens_model.to_dict())
+                    for _lens_model in [self.lens_model, *self.secondary_lens_models]
+                ]
+            ),
+            inverse_transformation_matrices=np.array(
+                [
+                    transformation_matrix.as_matrix()
+                    for transformation_matrix in self.inverse_transformation_matrices
+                ],
+                dtype=np.float32,
+            ).reshape(-1, 4, 4),
+            camera_vectors=self.camera_vectors,
+            rotated_camera_vectors=np.array(
+                [homography.rotated_camera_vectors for homography in self.homographies],
+                dtype=np.float32,
+            ).reshape(-1, *self.camera_vectors.shape),
+            translations=np.array(
+                [homography.translation for homography in self.homographies],
+                dtype=np.float32,
+            ).reshape(-1, 3),
+            cache_warps=np.array(self.cache_warps),
+            warp_keys=np.array(warp_keys, dtype=np.float64).reshape(-1, 3),
+            warps=np.array([self.warps[key] for key in warp_keys]).reshape(
+                -1, *self.camera_vectors.shape[:2], 2
+            ),
+        )
+
+    @staticmethod
+    def load(file_path: Path) -> PlaneSweepingRig:
+        data = np.load(file_path)
+        lens_models = [
+            LensModel.from_dict(json.loads(str(lens_model)))
+            for lens_model in data["lens_models"]
+        ]
+        return PlaneSweepingRig(
+            key=str(data["key"]),
+            lens_model=lens_models[0],
+            secondary_lens_models=lens_models[1:],
+            inverse_transformation_matrices=[
+                TransformationMatrix.from_matrix(matrix)
+                for matrix in data["inverse_transformation_matrices"]
+            ],
+            camera_vectors=data["camera_vectors"],
+            homographies=[
+                PlaneInducedHomography(
+                    rotated_camera_vectors=rotated_camera_vectors,
+                    translation=translation,
+                )
+                for rotated_camera_vectors, translation in zip(
+                    data["rotated_camera_vectors"], data["translations"]
+                )
+            ],
+            cache_warps=bool(data["cache_warps"]),
+            warps={
+                (int(engine), int(view), float(depth)): warp
+                for (engine, view, depth), warp in zip(data["warp_keys"], data["warps"])
+            },
+        )
+
+
+def _aggregate_cost(
+    cost: NDArray[Shape["H, W"], Float32], block_size: int
+) -> NDArray[Shape["H, W"], Float32]:
+    return box_filter(
+        values=cost, block_size=np.array([block_size, block_size], dtype=np.int32)
     )
 
 
-def plane_sweeping(  # type: ignore
+def _cost_at_depth(
+    image: NDArray[Shape["H, W, ..."], Float32],
+    secondary_images: list[NDArray[Shape["H, W, ..."], Float32]],
+    rig: PlaneSweepingRig,
+    depth: float | NDArray[Shape["H, W"], Float32],
+    block_size: int,
+    engine: PlaneSweepingEngine,
+    best_k: Optional[int],
+) -> NDArray[Shape["H, W"], Float32]:
+    if best_k is None:
+        single_pixel_error = np.zeros(image.shape[:2], dtype=np.float32)
+        for view, secondary_image in enumerate(secondary_images):
+            shifted_image = bilinear_warp(
+                image=secondary_image,
+                pixels=rig.pixels_at_depth(view=view, depth=depth, engine=engine),
+            )
+            single_pixel_error += np.abs(image - shifted_image).sum(axis=-1)
+
+        return _aggregate_cost(cost=single_pixel_error, block_size=block_size)
+
+    view_error = np.empty((len(secondary_images), *image.shape[:2]), dtype=np.float32)
+    for view, secondary_image in enumerate(secondary_images):
+        shifted_image = bilinear_warp(
+            image=secondary_image,
+            pixels=rig.pixels_at_depth(view=view, depth=depth, engine=engine),
+        )
+        view_error[view] = _aggregate_cost(
+            cost=np.abs(image - shifted_image).sum(axis=-1), block_size=block_size
+        )
+    return np.partition(view_error, best_k - 1, axis=0)[:best_k].sum(axis=0)
+
+
+@dataclass
+class _StopCondition:
+    deadline: Optional[float]
+    cancel_event: Optional[Event]
+
+    def is_met(self) -> bool:
+        return (self.deadline is not None and time.perf_counter() > self.deadline) or (
+            self.cancel_event is not None and self.cancel_event.is_set()
+        )
+
+
+def _sweep_depths(
+    image: NDArray[Shape["H, W, ..."], Float32],
+    secondary_images: list[NDArray[Shape["H, W, ..."], Float32]],
+    rig: PlaneSweepingRig,
+    depths: NDArray[Shape["N, ..."], Float32],
+    start: int,
+    stop: int,
+    block_size: int,
+    engine: PlaneSweepingEngine,
+    best_k: Optional[int],
+    stop_condition: Optional[_StopCondition],
+) -> Optional[RunningMinimum]:
+    number_of_depths = depths.shape[0]
+    running_minimum = RunningMinimum(
+        number_of_values=number_of_depths, shape=image.shape[:2]
+    )
+    for index in range(
+        max(0, min(start - 1, number_of_depths - 3)),
+        min(number_of_depths, max(stop + 1, 3)),
+    ):
+        if stop_condition is not None and stop_condition.is_met():
+            return None
+        running_minimum.update(
+            index=index,
+            value=_cost_at_depth(
+                image=image,
+                secondary_images=secondary_images,
+                rig=rig,
+                depth=depths[index],
+                block_size=block_size,
+                engine=engine,
+                best_k=best_k,
+            ),
+            is_candidate=start <= index < stop,
+        )
+    return running_minimum
+
+
+def _sweep(
+    image: NDArray[Shape["H, W, ..."], Float32],
+    secondary_images: list[NDArray[Shape["H, W, ..."], Float32]],
+    rig: PlaneSweepingRig,
+    depths: NDArray[Shape["N, ..."], Float32],
+    block_size: int,
+    engine: PlaneSweepingEngine,
+    workers: int,
+    best_k: Optional[int],
+    stop_condition: Optional[_StopCondition],
+) -> Optional[RunningMinimum]:
+    chunks = [
+        (int(indices[0]), int(indices[-1]) + 1)
+        for indices in np.array_split(np.arange(depths.shape[0]), workers)
+        if indices.size > 0
+    ]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                _sweep_depths,
+                image=image,
+                secondary_images=secondary_images,
+                rig=rig,
+                depths=depths,
+                start=start,
+                stop=stop,
+                block_size=block_size,
+                engine=engine,
+                best_k=best_k,
+                stop_condition=stop_condition,
+            )
+            for start, stop in chunks
+        ]
+        running_minima = [future.result() for future in futures]
+
+    running_minimum = running_minima[0]
+    for other in running_minima[1:]:
+        if running_minimum is None or other is None:
+            return None
+        running_minimum.merge(other)
+    return running_minimum
+
+
+def _sample_depths(
+    depth_range: NDArray[Shape["2"], Float32],
+    step_size: float,
+    depth_sampling: DepthSampling,
+) -> NDArray[Shape["N"], Float32]:
+    match depth_sampling:
+        case DepthSampling.UNIFORM:
+            return np.arange(
+                start=depth_range[0],
+                stop=depth_range[1] + step_size,
+                step=step_size,
+                dtype=np.float32,
+            )
+        case DepthSampling.INVERSE_DEPTH:
+            inverse_step_size = step_size / float(depth_range[0]) ** 2
+            inverse_depths = np.arange(
+                start=1 / float(depth_range[1]),
+                stop=1 / float(depth_range[0]) + inverse_step_size,
+                step=inverse_step_size,
+            )
+            return (1 / inverse_depths[::-1]).astype(np.float32)
+        case _:
+            raise ValueError("Invalid depth sampling")
+
+
+def _interpolate_depths(
+    depths: NDArray[Shape["N"], Float32],
+    index: NDArray[Shape["H, W"], Float32],
+    depth_sampling: DepthSampling,
+) -> NDArray[Shape["H, W"], Float32]:
+    sample_indices = np.arange(depths.shape[0])
+    match depth_sampling:
+        case DepthSampling.UNIFORM:
+            return np.interp(index, sample_indices, depths).astype(np.float32)
+        case DepthSampling.INVERSE_DEPTH:
+            return (1 / np.interp(index, sample_indices, 1 / depths)).astype(np.float32)
+        case _:
+            raise ValueError("Invalid depth sampling")
+
+
+def _depth_from_running_minimum(
+    depths: NDArray[Shape["N"], Float32],
+    running_minimum: RunningMinimum,
+    first_index: NDArray[Shape["H, W"], Int32],
+    stride: int,
+    subpixel_fit: bool,
+    depth_sampling: DepthSampling,
+) -> NDArray[Shape["H, W"], Float32]:
+    if subpixel_fit:
+        index = np.clip(
+            running_minimum.argmin(), 1, running_minimum.number_of_values - 2
+        )
+        depth = _interpolate_depths(
+            depths=depths,
+            index=first_index + stride * (index + running_minimum.subvalue_offset()),
+            depth_sampling=depth_sampling,
+        )
+    else:
+        depth = depths[first_index + stride * running_minimum.argmin()]
+
+    depth[depth >= depths.max()] = np.nan
+    depth[depth <= depths.min()] = np.nan
+    return depth
+
+
+def plane_sweeping(
     image: NDArray[Shape["H, W, ..."], Float32],
     lens_model: LensModel,
     secondary_images: list[NDArray[Shape["H, W, ..."], Float32]],
@@ -58,4 +623,163 @@ def plane_sweeping(  # type: ignore
     step_size: float,
     block_size: int,
     subpixel_fit: bool = True,
-) -> NDArray[Shape["H, W, 3"], Float32]: ...
+    engine: PlaneSweepingEngine = PlaneSweepingEngine.REPROJECTION,
+    workers: int = 1,
+    rig: Optional[PlaneSweepingRig] = None,
+    depth_sampling: DepthSampling = DepthSampling.UNIFORM,
+    coarse_to_fine_factor: int = 1,
+    best_k: Optional[int] = None,
+    coarse_to_fine_rounds: int = 2,
+    progress_callback: Optional[
+        Callable[[NDArray[Shape["H, W, 3"], Float32]], None]
+    ] = None,
+    time_budget: Optional[float] = None,
+    cancel_event: Optional[Event] = None,
+) -> NDArray[Shape["H, W, 3"], Float32]:
+    if best_k is not None and not 1 <= best_k <= len(secondary_images):
+        raise ValueError("best_k must be between 1 and the number of secondary images")
+
+    if (time_budget is not None or cancel_event is not None) and (
+        coarse_to_fine_factor == 1 or coarse_to_fine_rounds == 1
+    ):
+        raise ValueError(
+            "time_budget and cancel_event require more than one coarse-to-fine round"
+        )
+
+    height, width = image.shape[:2]
+    if rig is None:
+        rig = PlaneSweepingRig.from_cameras(
+            lens_model=lens_model,
+            secondary_lens_models=secondary_lens_models,
+            secondary_transformation_matrices=secondary_transformation_matrices,
+            shape=(height, width),
+        )
+    elif not rig.matches(
+        lens_model=lens_model,
+        secondary_lens_models=secondary_lens_models,
+        secondary_transformation_matrices=secondary_transformation_matrices,
+        shape=(height, width),
+    ):
+        raise ValueError("Plane sweeping rig does not match the given cameras")
+
+    depths = _sample_depths(
+        depth_range=depth_range, step_size=step_size, depth_sampling=depth_sampling
+    )
+    number_of_depths = depths.shape[0]
+    strides = sorted(
+        {
+            coarse_to_fine_factor**exponent
+            for exponent in range(coarse_to_fine_rounds)
+            if 2 * coarse_to_fine_factor**exponent + 1 < number_of_depths
+        }
+        | {1},
+        reverse=True,
+    )
+    stop_condition = _StopCondition(
+        deadline=None if time_budget is None else time.perf_counter() + time_budget,
+        cancel_event=cancel_event,
+    )
+
+    xyz = np.full((*image.shape[:2], 3), np.nan, dtype=np.float32)
+    best_index = np.zeros(image.shape[:2], dtype=np.int32)
+    for round_index, stride in enumerate(strides):
+        if round_index == 0:
+            first_index = np.zeros(image.shape[:2], dtype=np.int32)
+            sweep_depths = depths[::stride]
+        else:
+            previous_stride = strides[round_index - 1]
+            first_index = np.clip(
+                best_index - previous_stride,
+                0,
+                number_of_depths - 1 - 2 * previous_stride,
+            )
+            band = stride * np.arange(2 * previous_stride // stride + 1)
+            sweep_depths = depths[first_index + band[:, None, None]]
+
+        running_minimum = _sweep(
+            image=image,
+            secondary_images=secondary_images,
+            rig=rig,
+            depths=sweep_depths,
+            block_size=block_size,
+            engine=engine,
+            workers=workers,
+            best_k=best_k,
+            stop_condition=None if round_index == 0 else stop_condition,
+        )
+        if running_minimum is None:
+            break
+
+        best_index = first_index + stride * running_minimum.argmin()
+        xyz = (
+            rig.camera_vectors
+            * _depth_from_running_minimum(
+                depths=depths,
+                running_minimum=running_minimum,
+                first_index=first_index,
+                stride=stride,
+                subpixel_fit=subpixel_fit,
+                depth_sampling=depth_sampling,
+            )[..., None]
+        )
+        if progress_callback is not None:
+            progress_callback(xyz)
+        if stop_condition.is_met():
+            break
+
+    return xyz
+
+
+def plane_sweeping_with_camera_rig(
+    images: list[NDArray[Shape["H, W, ..."], Float32]],
+    camera_rig: CameraRig,
+    depth_range: NDArray[Shape["2"], Float32],
+    step_size: float,
+    block_size: int,
+    reference_camera: int = 0,
+    subpixel_fit: bool = True,
+    engine: PlaneSweepingEngine = PlaneSweepingEngine.REPROJECTION,
+    workers: int = 1,
+    rig: Optional[PlaneSweepingRig] = None,
+    depth_sampling: DepthSampling = DepthSampling.UNIFORM,
+    coarse_to_fine_factor: int = 1,
+    best_k: Optional[int] = None,
+    coarse_to_fine_rounds: int = 2,
+    progress_callback: Optional[
+        Callable[[NDArray[Shape["H, W, 3"], Float32]], None]
+    ] = None,
+    time_budget: Optional[float] = None,
+    cancel_event: Optional[Event] = None,
+) -> NDArray[Shape["H, W, 3"], Float32]:
+    if len(images) != len(camera_rig):
+        raise ValueError("Expected one image per camera in the rig")
+
+    secondary_cameras = _secondary_cameras(
+        camera_rig=camera_rig, reference_camera=reference_camera
+    )
+    return plane_sweeping(
+        image=images[reference_camera],
+        lens_model=camera_rig.lens_model(reference_camera),
+        secondary_images=[images[index] for index in secondary_cameras],
+        secondary_lens_models=[
+            camera_rig.lens_model(index) for index in secondary_cameras
+        ],
+        secondary_transformation_matrices=[
+            camera_rig.transformation_matrix(index, reference=reference_camera)
+            for index in secondary_cameras
+        ],
+        depth_range=depth_range,
+        step_size=step_size,
+        block_size=block_size,
+        subpixel_fit=subpixel_fit,
+        engine=engine,
+        workers=workers,
+        rig=rig,
+        depth_sampling=depth_sampling,
+        coarse_to_fine_factor=coarse_to_fine_factor,
+        best_k=best_k,
+        coarse_to_fine_rounds=coarse_to_fine_rounds,
+        progress_callback=progress_callback,
+        time_budget=time_budget,
+        cancel_event=cancel_event,
+    )
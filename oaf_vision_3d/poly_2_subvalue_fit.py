@@ -1,25 +1,21 @@
 # %% [markdown]
 # # Polyfit 2 subvalue local minima
+#
+# `np.argmin` over the first axis of a volume copies the whole volume to make that axis
+# contiguous, so `argmin` does it for a block of `_ARGMIN_ROWS` rows at a time instead.
 
 # %%
 import numpy as np
-from nptyping import Float32, NDArray, Shape
+from nptyping import Float32, Int64, NDArray, Number, Shape
 
+_ARGMIN_ROWS = 32
 
-def find_subvalue_poly_2(
-    values: NDArray[Shape["N"], Float32],
-    function_value: NDArray[Shape["N, H, W"], Float32],
-) -> NDArray[Shape["H, W"], Float32]:
-    h_idx = np.arange(function_value.shape[1])
-    w_idx = np.arange(function_value.shape[2])
-    h_idx, w_idx = np.meshgrid(h_idx, w_idx, indexing="ij")
-
-    idx = np.clip(np.argmin(function_value, axis=0), 1, values.shape[0] - 2)
-
-    f_0 = function_value[idx - 1, h_idx, w_idx]
-    f_1 = function_value[idx, h_idx, w_idx]
-    f_2 = function_value[idx + 1, h_idx, w_idx]
 
+def subvalue_offset_poly_2(
+    f_0: NDArray[Shape["H, W"], Float32],
+    f_1: NDArray[Shape["H, W"], Float32],
+    f_2: NDArray[Shape["H, W"], Float32],
+) -> NDArray[Shape["H, W"], Float32]:
     a = 0.5 * (f_0 + f_2) - f_1
     b = 0.5 * (f_2 - f_0)
 
@@ -27,6 +23,32 @@ def find_subvalue_poly_2(
     denom = np.where(denom == 0, np.nan, denom)
 
     delta = -b / denom
-    delta = np.where(np.abs(delta) > 1, np.nan, delta)
+    return np.where(np.abs(delta) > 1, np.nan, delta)
+
+
+def argmin(
+    function_value: NDArray[Shape["N, H, W"], Number],
+) -> NDArray[Shape["H, W"], Int64]:
+    index = np.empty(function_value.shape[1:], dtype=np.int64)
+    for start in range(0, function_value.shape[1], _ARGMIN_ROWS):
+        index[start : start + _ARGMIN_ROWS] = np.argmin(
+            function_value[:, start : start + _ARGMIN_ROWS], axis=0
+        )
+    return index
+
+
+def find_subvalue_poly_2(
+    values: NDArray[Shape["N"], Float32],
+    function_value: NDArray[Shape["N, H, W"], Number],
+) -> NDArray[Shape["H, W"], Float32]:
+    h_idx = np.arange(function_value.shape[1])
+    w_idx = np.arange(function_value.shape[2])
+    h_idx, w_idx = np.meshgrid(h_idx, w_idx, indexing="ij")
+
+    idx = np.clip(argmin(function_value), 1, values.shape[0] - 2)
+
+    f_0 = function_value[idx - 1, h_idx, w_idx].astype(np.float32)
+    f_1 = function_value[idx, h_idx, w_idx].astype(np.float32)
+    f_2 = function_value[idx + 1, h_idx, w_idx].astype(np.float32)
 
-    return values[idx] + delta
+    return values[idx] + subvalue_offset_poly_2(f_0=f_0, f_1=f_1, f_2=f_2)
@@ -6,6 +6,9 @@
 # detail in the workshop [4: 3D-2D Projections and PnP](../workshops/04_3d_2d_projections_and_pnp.ipynb).
 
 # %%
+from typing import Optional
+
+import numpy as np
 from nptyping import Float32, NDArray, Shape
 
 from oaf_vision_3d.lens_model import LensModel
@@ -16,13 +19,15 @@ def project_points(
     points: NDArray[Shape["*, 3"], Float32],
     lens_model: LensModel,
     transformation_matrix: TransformationMatrix = TransformationMatrix(),
+    out: Optional[NDArray[Shape["*, 2"], Float32]] = None,
 ) -> NDArray[Shape["*, 2"], Float32]:
-    transformed_points = transformation_matrix @ points[None, ...]
+    transformed_points = transformation_matrix.rotate(points=points[None, ...])
+    transformed_points += transformation_matrix.translation
 
-    undistorted_normalized_pixels = (
-        transformed_points[..., :2] / transformed_points[..., 2:]
-    )
-    normalized_pixels = lens_model.distort_pixels(
-        normalized_pixels=undistorted_normalized_pixels
+    pixels = np.divide(
+        transformed_points[..., :2],
+        transformed_points[..., 2:],
+        out=None if out is None else out[None, ...],
     )
-    return lens_model.denormalize_pixels(pixels=normalized_pixels)[0]
+    lens_model.distort_pixels(normalized_pixels=pixels, out=pixels)
+    return lens_model.denormalize_pixels(pixels=pixels, out=pixels)[0]
@@ -0,0 +1,137 @@
+# %% [markdown]
+# # Pyramid Block Matching
+#
+# Brute-force [block matching](block_matching.py) evaluates every integer disparity in
+# the disparity range at full resolution, which is slow when the range is hundreds of
+# pixels wide. This function instead builds an image pyramid by repeatedly averaging
+# 2x2 pixel blocks, does the full disparity search on the smallest image only, and
+# then refines the estimate level by level. At every finer level the disparity from
+# the level below is doubled and upsampled, and only a narrow band of
+# `search_radius` pixels around it is evaluated per pixel.
+#
+# `uint8` images are averaged in `uint16` and rounded back to `uint8`, so the sum of
+# the four pixels can not overflow.
+#
+# Pixels that end up invalid on a coarse level are filled with the nearest valid
+# estimate before they are refined, so they still get a guess to search around.
+
+# %%
+import numpy as np
+from nptyping import Float32, Int32, NDArray, Number, Shape
+from scipy.ndimage import distance_transform_edt
+
+from oaf_vision_3d.block_matching import (
+    Aggregation,
+    CostFunction,
+    block_matching,
+    block_matching_around_disparity,
+)
+
+
+def _downsample(
+    image: NDArray[Shape["H, W, ..."], Number],
+) -> NDArray[Shape["H, W, ..."], Number]:
+    height, width = image.shape[0] // 2 * 2, image.shape[1] // 2 * 2
+    image = image[:height, :width]
+    if image.dtype == np.uint8:
+        pixel_sum = np.add(image[0::2, 0::2], image[1::2, 0::2], dtype=np.uint16)
+        pixel_sum += image[0::2, 1::2]
+        pixel_sum += image[1::2, 1::2]
+        return ((pixel_sum + 2) // 4).astype(np.uint8)
+    return (
+        0.25
+        * (
+            image[0::2, 0::2]
+            + image[1::2, 0::2]
+            + image[0::2, 1::2]
+            + image[1::2, 1::2]
+        )
+    ).astype(image.dtype)
+
+
+def _upsample_disparity(
+    disparity: NDArray[Shape["H, W"], Float32],
+    shape: tuple[int, int],
+    disparity_range: NDArray[Shape["2"], Float32],
+) -> NDArray[Shape["H, W"], Int32]:
+    invalid = np.isnan(disparity)
+    if invalid.all():
+        disparity = np.full_like(disparity, 0.5 * np.mean(disparity_range))
+    elif invalid.any():
+        nearest_valid = distance_transform_edt(
+            invalid, return_distances=False, return_indices=True
+        )
+        disparity = disparity[tuple(nearest_valid)]
+
+    upsampled = 2 * np.repeat(np.repeat(disparity, 2, axis=0), 2, axis=1)
+    upsampled = np.pad(
+        upsampled,
+        ((0, shape[0] - upsampled.shape[0]), (0, shape[1] - upsampled.shape[1])),
+        mode="edge",
+    )
+    return np.clip(
+        np.round(upsampled), disparity_range[0], disparity_range[1] - 1
+    ).astype(np.int32)
+
+
+def pyramid_block_matching(
+    image_0: NDArray[Shape["H, W"], Number],
+    image_1: NDArray[Shape["H, W"], Number],
+    disparity_range: NDArray[Shape["2"], Float32],
+    block_size: NDArray[Shape["[x, y]"], Int32] = np.array([11, 11], dtype=np.int32),
+    subpixel_fit: bool = True,
+    cost_function: CostFunction = CostFunction.SUM_OF_ABSOLUTE_DIFFERENCE,
+    aggregation: Aggregation = Aggregation.CONVOLVE_2D,
+    number_of_levels: int = 3,
+    search_radius: int = 2,
+) -> NDArray[Shape["H, W"], Float32]:
+    images_0 = [image_0]
+    images_1 = [image_1]
+    for _ in range(number_of_levels):
+        images_0.append(_downsample(images_0[-1]))
+        images_1.append(_downsample(images_1[-1]))
+
+    scale = 2**number_of_levels
+    disparity = block_matching(
+        image_0=images_0[-1],
+        image_1=images_1[-1],
+        disparity_range=np.array(
+            [
+                np.floor(disparity_range[0] / scale),
+                np.ceil(disparity_range[1] / scale),
+            ],
+            dtype=np.float32,
+        ),
+        block_size=block_size,
+        subpixel_fit=subpixel_fit,
+        cost_function=cost_function,
+        aggregation=aggregation,
+    )
+
+    for level in reversed(range(number_of_levels)):
+        scale = 2**level
+        level_disparity_range = np.array(
+            [
+                np.floor(disparity_range[0] / scale),
+                np.ceil(disparity_range[1] / scale),
+            ],
+            dtype=np.float32,
+        )
+        height, width = images_0[level].shape[:2]
+        disparity = block_matching_around_disparity(
+            image_0=images_0[level],
+            image_1=images_1[level],
+            disparity_range=level_disparity_range,
+            initial_disparity=_upsample_disparity(
+                disparity=disparity,
+                shape=(height, width),
+                disparity_range=level_disparity_range,
+            ),
+            search_radius=search_radius,
+            block_size=block_size,
+            subpixel_fit=subpixel_fit,
+            cost_function=cost_function,
+            aggregation=aggregation,
+        )
+
+    return disparity
@@ -0,0 +1,90 @@
+# %% [markdown]
+# # Running Minimum
+#
+# When we search for the best disparity (or depth) we do not need to keep the full cost
+# volume in memory. This class consumes one cost image at a time and only keeps the
+# best value and index per pixel, together with the three costs around the minimum that
+# the [polyfit 2 subvalue fit](poly_2_subvalue_fit.py) needs. The memory is therefore
+# independent of the number of evaluated values.
+#
+# The result is identical to calling `np.argmin` and `find_subvalue_poly_2` on the
+# stacked cost volume, including how ties and NaN values are handled.
+#
+# To split the values over several workers, every worker feeds its chunk together with
+# the value on either side of it, marking only the values of its own chunk as
+# candidates for the minimum. The neighbours of a minimum at the edge of the chunk are
+# then still complete. Merging the running minima in order gives the same result as a
+# single running minimum over all values, as earlier chunks win ties.
+
+# %%
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+
+import numpy as np
+from nptyping import Bool, Float32, Int32, NDArray, Shape
+
+from oaf_vision_3d.poly_2_subvalue_fit import subvalue_offset_poly_2
+
+
+@dataclass
+class RunningMinimum:
+    number_of_values: int
+    shape: tuple[int, ...]
+    minimum: NDArray[Shape["H, W"], Float32] = field(init=False)
+    index: NDArray[Shape["H, W"], Int32] = field(init=False)
+    neighbours: NDArray[Shape["3, H, W"], Float32] = field(init=False)
+    _window: list[tuple[int, NDArray[Shape["H, W"], Float32]]] = field(
+        init=False, default_factory=list
+    )
+
+    def __post_init__(self) -> None:
+        self.minimum = np.full(self.shape, np.inf, dtype=np.float32)
+        self.index = np.zeros(self.shape, dtype=np.int32)
+        self.neighbours = np.full((3, *self.shape), np.nan, dtype=np.float32)
+
+    def _is_better(
+        self, value: NDArray[Shape["H, W"], Float32]
+    ) -> NDArray[Shape["H, W"], Bool]:
+        return (value < self.minimum) | (np.isnan(value) & ~np.isnan(self.minimum))
+
+    def update(
+        self,
+        index: int,
+        value: NDArray[Shape["H, W"], Float32],
+        is_candidate: bool = True,
+    ) -> None:
+        if self._window and self._window[-1][0] + 1 != index:
+            raise ValueError("Values must be added in consecutive order.")
+
+        value = np.asarray(value, dtype=np.float32)
+        if is_candidate:
+            is_better = self._is_better(value)
+            np.copyto(self.minimum, value, where=is_better)
+            np.copyto(self.index, np.int32(index), where=is_better)
+
+        self._window = [*self._window[-2:], (index, value)]
+        if len(self._window) == 3:
+            is_centered = np.clip(self.index, 1, self.number_of_values - 2) == index - 1
+            for neighbour, (_, window_value) in zip(self.neighbours, self._window):
+                np.copyto(neighbour, window_value, where=is_centered)
+
+    def merge(self, other: RunningMinimum) -> None:
+        is_better = self._is_better(other.minimum)
+        np.copyto(self.minimum, other.minimum, where=is_better)
+        np.copyto(self.index, other.index, where=is_better)
+        np.copyto(self.neighbours, other.neighbours, where=is_better[None])
+
+    def argmin(self) -> NDArray[Shape["H, W"], Int32]:
+        return self.index
+
+    def subvalue_offset(self) -> NDArray[Shape["H, W"], Float32]:
+        return subvalue_offset_poly_2(
+            f_0=self.neighbours[0], f_1=self.neighbours[1], f_2=self.neighbours[2]
+        )
+
+    def find_subvalue_poly_2(
+        self, values: NDArray[Shape["N"], Float32]
+    ) -> NDArray[Shape["H, W"], Float32]:
+        idx = np.clip(self.index, 1, self.number_of_values - 2)
+        return values[idx] + self.subvalue_offset()
@@ -0,0 +1,121 @@
+# %% [markdown]
+# # Semi-Global Matching
+#
+# Window aggregation only looks at a small neighbourhood, so the disparity maps are
+# noisy unless the windows are very large. Semi-global matching (SGM) instead adds a
+# smoothness term along 1D paths through the image. For every direction `r` the path
+# cost is
+#
+# $$L_r(p, d) = C(p, d) + \min\left(L_r(p - r, d), L_r(p - r, d \pm 1) + P_1,
+# \min_k L_r(p - r, k) + P_2\right) - \min_k L_r(p - r, k)$$
+#
+# where $P_1$ penalizes small disparity changes and $P_2$ larger jumps. The path
+# costs of all directions are summed, and the disparity is found from the summed
+# volume just as for window aggregation.
+#
+# To keep the memory bounded the costs are quantized to `uint16`, scaled such that the
+# sum over all directions can never overflow. The image is scanned one line at a time,
+# so besides the quantized and the summed volume only one line of path costs is kept
+# per direction.
+
+# %%
+from dataclasses import dataclass
+
+import numpy as np
+from nptyping import NDArray, Number, Shape, UInt16
+
+
+@dataclass
+class SemiGlobalMatchingParameters:
+    penalty_1: float
+    penalty_2: float
+    number_of_directions: int = 8
+
+
+_DIRECTIONS = {
+    4: [(0, 1), (0, -1), (1, 0), (-1, 0)],
+    8: [(0, 1), (0, -1), (1, 0), (-1, 0), (1, 1), (1, -1), (-1, 1), (-1, -1)],
+}
+
+
+def _scan_lines(
+    cost: NDArray[Shape["N, H, W"], UInt16],
+    summed_cost: NDArray[Shape["N, H, W"], UInt16],
+    direction: tuple[int, int],
+    penalty_1: int,
+    penalty_2: int,
+) -> None:
+    step_y, step_x = direction
+    rows = range(cost.shape[1]) if step_y > 0 else reversed(range(cost.shape[1]))
+
+    previous = None
+    shifted = np.zeros((cost.shape[0], cost.shape[2]), dtype=np.int32)
+    for row in rows:
+        current = cost[:, row, :].astype(np.int32)
+        if previous is not None:
+            match step_x:
+                case 1:
+                    shifted[:, 1:] = previous[:, :-1]
+                case -1:
+                    shifted[:, :-1] = previous[:, 1:]
+                case _:
+                    shifted[:] = previous
+
+            minimum = shifted.min(axis=0)
+            best = np.minimum(shifted, minimum + penalty_2)
+            best[1:] = np.minimum(best[1:], shifted[:-1] + penalty_1)
+            best[:-1] = np.minimum(best[:-1], shifted[1:] + penalty_1)
+            current += best - minimum
+
+        np.add(
+            summed_cost[:, row, :],
+            current,
+            out=summed_cost[:, row, :],
+            casting="unsafe",
+        )
+        previous = current
+
+
+def semi_global_matching(
+    cost_volume: NDArray[Shape["N, H, W"], Number],
+    parameters: SemiGlobalMatchingParameters,
+) -> NDArray[Shape["N, H, W"], UInt16]:
+    if parameters.number_of_directions not in _DIRECTIONS:
+        raise ValueError("Number of directions must be 4 or 8")
+    if not 0 <= parameters.penalty_1 <= parameters.penalty_2:
+        raise ValueError("Penalties must satisfy 0 <= penalty_1 <= penalty_2")
+
+    maximum_cost = float(np.nanmax(cost_volume))
+    scale = (np.iinfo(np.uint16).max // parameters.number_of_directions - 1) / (
+        maximum_cost + parameters.penalty_2
+    )
+    cost = np.empty(cost_volume.shape, dtype=np.uint16)
+    for _cost, _cost_volume in zip(cost, cost_volume):
+        np.multiply(
+            np.nan_to_num(_cost_volume, nan=maximum_cost),
+            scale,
+            out=_cost,
+            casting="unsafe",
+        )
+    penalty_1 = int(parameters.penalty_1 * scale)
+    penalty_2 = int(parameters.penalty_2 * scale)
+
+    summed_cost = np.zeros(cost_volume.shape, dtype=np.uint16)
+    for direction in _DIRECTIONS[parameters.number_of_directions]:
+        if direction[0] == 0:
+            _scan_lines(
+                cost=cost.transpose(0, 2, 1),
+                summed_cost=summed_cost.transpose(0, 2, 1),
+                direction=(direction[1], 0),
+                penalty_1=penalty_1,
+                penalty_2=penalty_2,
+            )
+        else:
+            _scan_lines(
+                cost=cost,
+                summed_cost=summed_cost,
+                direction=direction,
+                penalty_1=penalty_1,
+                penalty_2=penalty_2,
+            )
+    return summed_cost
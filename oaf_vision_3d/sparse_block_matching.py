@@ -0,0 +1,163 @@
+# %% [markdown]
+# # Sparse Block Matching
+#
+# Often we only need the disparity of a few pixels, e.g. keypoints or the pixels of a
+# detected object. Dense [block matching](block_matching.py) still computes the cost of
+# every pixel for every disparity. These functions instead gather the aggregation
+# window around each requested pixel once, and only evaluate the cost inside those
+# windows. The result is the same as reading the dense disparity map at the requested
+# pixels, but the work scales with the number of requested pixels instead of the
+# image size.
+#
+# The pixels are given as `[x, y]` coordinates, or as a boolean mask. Gathering a
+# window per pixel evaluates `block_size[0] * block_size[1]` costs per pixel, so when
+# the masked pixels are clustered it is cheaper to run dense block matching on their
+# bounding box instead. The box is padded by the aggregation window and the largest
+# disparity, so the masked pixels get exactly the same result as in the full image.
+# If the padded box reaches outside the image, it spans the full width, since the
+# shifted costs wrap around the image columns.
+
+# %%
+import numpy as np
+from nptyping import Bool, Float32, Int32, NDArray, Number, Shape
+
+from oaf_vision_3d.block_matching import (
+    CENSUS_WINDOW_SIZE,
+    CostFunction,
+    block_matching,
+    get_cost,
+    prepare_image,
+)
+from oaf_vision_3d.poly_2_subvalue_fit import find_subvalue_poly_2
+
+_CHUNK_SIZE = 4096
+
+
+def _window_offsets(size: int) -> NDArray[Shape["K"], Int32]:
+    after = (size - 1) // 2
+    return np.arange(after - size + 1, after + 1, dtype=np.int32)
+
+
+def _sparse_disparity_error(
+    image_0: NDArray[Shape["H, W, ..."], Number],
+    image_1: NDArray[Shape["H, W, ..."], Number],
+    pixels: NDArray[Shape["P, 2"], Int32],
+    disparities: NDArray[Shape["N"], Int32],
+    block_size: NDArray[Shape["[x, y]"], Int32],
+    cost_function: CostFunction,
+) -> NDArray[Shape["N, P"], Float32]:
+    height, width = image_0.shape[:2]
+    rows = pixels[:, 1, None, None] + _window_offsets(int(block_size[1]))[:, None]
+    columns = pixels[:, 0, None, None] + _window_offsets(int(block_size[0]))
+    rows, columns = np.broadcast_arrays(rows, columns)
+    is_inside = (rows >= 0) & (rows < height) & (columns >= 0) & (columns < width)
+    rows = np.clip(rows, 0, height - 1)
+    columns = np.clip(columns, 0, width - 1)
+
+    window_0 = image_0[rows, columns]
+    error = np.empty((disparities.shape[0], pixels.shape[0]), dtype=np.float32)
+    for index, _disparity in enumerate(disparities):
+        window_1 = image_1[rows, (columns - _disparity) % width]
+        single_pixel_error = get_cost(window_0, window_1, cost_function)
+        error[index] = np.where(is_inside, single_pixel_error, 0).sum(axis=(1, 2)) / (
+            int(block_size[0]) * int(block_size[1])
+        )
+    return error
+
+
+def sparse_block_matching(
+    image_0: NDArray[Shape["H, W"], Number],
+    image_1: NDArray[Shape["H, W"], Number],
+    pixels: NDArray[Shape["P, 2"], Int32],
+    disparity_range: NDArray[Shape["2"], Float32],
+    block_size: NDArray[Shape["[x, y]"], Int32] = np.array([11, 11], dtype=np.int32),
+    subpixel_fit: bool = True,
+    cost_function: CostFunction = CostFunction.SUM_OF_ABSOLUTE_DIFFERENCE,
+) -> NDArray[Shape["P"], Float32]:
+    disparities = np.arange(disparity_range[0], disparity_range[1], dtype=np.int32)
+    image_0 = prepare_image(image=image_0, cost_function=cost_function)
+    image_1 = prepare_image(image=image_1, cost_function=cost_function)
+    pixels = np.asarray(pixels, dtype=np.int32).reshape(-1, 2)
+
+    disparity = np.empty(pixels.shape[0], dtype=np.float32)
+    for start in range(0, pixels.shape[0], _CHUNK_SIZE):
+        disparity_error = _sparse_disparity_error(
+            image_0=image_0,
+            image_1=image_1,
+            pixels=pixels[start : start + _CHUNK_SIZE],
+            disparities=disparities,
+            block_size=block_size,
+            cost_function=cost_function,
+        )
+        if subpixel_fit:
+            disparity[start : start + _CHUNK_SIZE] = find_subvalue_poly_2(
+                values=disparities.astype(np.float32),
+                function_value=disparity_error[..., None],
+            )[:, 0]
+        else:
+            disparity[start : start + _CHUNK_SIZE] = disparities[
+                np.argmin(disparity_error, axis=0)
+            ]
+
+    border = int(np.abs(disparities).max())
+    disparity[pixels[:, 0] < border] = np.nan
+    disparity[pixels[:, 0] >= image_0.shape[1] - border] = np.nan
+    disparity[disparity >= disparities.max()] = np.nan
+    disparity[disparity <= disparities.min()] = np.nan
+
+    return disparity
+
+
+def masked_block_matching(
+    image_0: NDArray[Shape["H, W"], Number],
+    image_1: NDArray[Shape["H, W"], Number],
+    mask: NDArray[Shape["H, W"], Bool],
+    disparity_range: NDArray[Shape["2"], Float32],
+    block_size: NDArray[Shape["[x, y]"], Int32] = np.array([11, 11], dtype=np.int32),
+    subpixel_fit: bool = True,
+    cost_function: CostFunction = CostFunction.SUM_OF_ABSOLUTE_DIFFERENCE,
+) -> NDArray[Shape["H, W"], Float32]:
+    rows, columns = np.nonzero(mask)
+    disparity = np.full(mask.shape, np.nan, dtype=np.float32)
+    if rows.size == 0:
+        return disparity
+
+    height, width = mask.shape
+    halo = np.asarray(block_size, dtype=np.int32) // 2
+    if cost_function is CostFunction.CENSUS:
+        halo += CENSUS_WINDOW_SIZE // 2
+    margin = int(np.abs(disparity_range).max()) + int(halo[0])
+    row_start = max(int(rows.min()) - int(halo[1]), 0)
+    row_stop = min(int(rows.max()) + int(halo[1]) + 1, height)
+    column_start = int(columns.min()) - margin
+    column_stop = int(columns.max()) + margin + 1
+    if column_start < 0 or column_stop > width:
+        column_start, column_stop = 0, width
+
+    box_area = (row_stop - row_start) * (column_stop - column_start)
+    if rows.size * int(block_size[0]) * int(block_size[1]) < box_area:
+        disparity[rows, columns] = sparse_block_matching(
+            image_0=image_0,
+            image_1=image_1,
+            pixels=np.stack([columns, rows], axis=-1),
+            disparity_range=disparity_range,
+            block_size=block_size,
+            subpixel_fit=subpixel_fit,
+            cost_function=cost_function,
+        )
+        return disparity
+
+    box = (slice(row_start, row_stop), slice(column_start, column_stop))
+    disparity[box] = np.where(
+        mask[box],
+        block_matching(
+            image_0=image_0[box],
+            image_1=image_1[box],
+            disparity_range=disparity_range,
+            block_size=block_size,
+            subpixel_fit=subpixel_fit,
+            cost_function=cost_function,
+        ),
+        np.nan,
+    )
+    return disparity
@@ -0,0 +1,165 @@
+# %% [markdown]
+# # Stereo Matcher
+#
+# For video from a fixed stereo rig the disparity of a pixel changes little from one
+# frame to the next. This class keeps the disparity map of the previous frame, and for
+# the next frame only searches a band of `search_radius` pixels around it using
+# [`block_matching_around_disparity`](block_matching.py). Pixels without a previous
+# disparity are searched around the nearest pixel that has one, so the costs they add
+# to the aggregation windows of their neighbours come from a plausible disparity.
+#
+# The band search is not trusted everywhere. Pixels fall back to a full search over the
+# disparity range when:
+# - the previous disparity was NaN,
+# - the best cost lies on the edge of the band, i.e. the disparity moved further than
+#   the band reaches (a cost that is flat at the lower edge is ambiguous, not moved),
+# - the best cost is above `maximum_cost` (if given).
+#
+# The fallback only evaluates the flagged pixels with
+# [masked block matching](sparse_block_matching.py). Pixels that are still invalid
+# after a full search, e.g. in textureless or occluded regions, are remembered in
+# `invalid_age` and stay NaN without being searched again until
+# `invalid_rescan_interval` frames have passed. The first frame, or a frame with a new
+# image size, is always searched in full.
+
+# %%
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+from nptyping import Float32, Int32, NDArray, Number, Shape
+from scipy.ndimage import distance_transform_edt
+
+from oaf_vision_3d.block_matching import (
+    Aggregation,
+    CostFunction,
+    block_matching,
+    block_matching_around_disparity_with_running_minimum,
+)
+from oaf_vision_3d.sparse_block_matching import masked_block_matching
+
+
+@dataclass
+class StereoMatcher:
+    disparity_range: NDArray[Shape["2"], Float32]
+    block_size: NDArray[Shape["[x, y]"], Int32] = field(
+        default_factory=lambda: np.array([11, 11], dtype=np.int32)
+    )
+    subpixel_fit: bool = True
+    cost_function: CostFunction = CostFunction.SUM_OF_ABSOLUTE_DIFFERENCE
+    aggregation: Aggregation = Aggregation.CONVOLVE_2D
+    search_radius: int = 2
+    maximum_cost: Optional[float] = None
+    invalid_rescan_interval: int = 30
+    previous_disparity: Optional[NDArray[Shape["H, W"], Float32]] = None
+    invalid_age: Optional[NDArray[Shape["H, W"], Int32]] = None
+
+    def reset(self) -> None:
+        self.previous_disparity = None
+        self.invalid_age = None
+
+    def _full_search(
+        self,
+        image_0: NDArray[Shape["H, W"], Number],
+        image_1: NDArray[Shape["H, W"], Number],
+    ) -> NDArray[Shape["H, W"], Float32]:
+        return block_matching(
+            image_0=image_0,
+            image_1=image_1,
+            disparity_range=self.disparity_range,
+            block_size=self.block_size,
+            subpixel_fit=self.subpixel_fit,
+            cost_function=self.cost_function,
+            aggregation=self.aggregation,
+        )
+
+    def _warm_start_search(
+        self,
+        image_0: NDArray[Shape["H, W"], Number],
+        image_1: NDArray[Shape["H, W"], Number],
+        previous_disparity: NDArray[Shape["H, W"], Float32],
+        invalid_age: NDArray[Shape["H, W"], Int32],
+    ) -> tuple[NDArray[Shape["H, W"], Float32], NDArray[Shape["H, W"], Int32]]:
+        disparities = np.arange(
+            self.disparity_range[0], self.disparity_range[1], dtype=np.int32
+        )
+        is_invalid = np.isnan(previous_disparity)
+        is_known_invalid = (invalid_age >= 0) & (
+            invalid_age < self.invalid_rescan_interval
+        )
+        if is_invalid.all():
+            previous_disparity = np.full_like(previous_disparity, disparities.mean())
+        elif is_invalid.any():
+            nearest_valid = distance_transform_edt(
+                is_invalid, return_distances=False, return_indices=True
+            )
+            previous_disparity = previous_disparity[tuple(nearest_valid)]
+        initial_disparity = np.clip(
+            np.round(previous_disparity), disparities.min(), disparities.max()
+        ).astype(np.int32)
+
+        disparity, running_minimum = (
+            block_matching_around_disparity_with_running_minimum(
+                image_0=image_0,
+                image_1=image_1,
+                disparity_range=self.disparity_range,
+                initial_disparity=initial_disparity,
+                search_radius=self.search_radius,
+                block_size=self.block_size,
+                subpixel_fit=self.subpixel_fit,
+                cost_function=self.cost_function,
+                aggregation=self.aggregation,
+            )
+        )
+        disparity[is_known_invalid] = np.nan
+
+        is_below_band = (running_minimum.argmin() == 0) & (
+            running_minimum.neighbours[0] < running_minimum.neighbours[1]
+        )
+        is_above_band = running_minimum.argmin() == 2 * self.search_radius
+        needs_full_search = is_invalid | is_below_band | is_above_band
+        if self.maximum_cost is not None:
+            needs_full_search |= running_minimum.minimum > self.maximum_cost
+        needs_full_search &= ~is_known_invalid
+        border = int(np.abs(disparities).max())
+        needs_full_search[:, :border] = False
+        needs_full_search[:, -border:] = False
+
+        if needs_full_search.any():
+            disparity[needs_full_search] = masked_block_matching(
+                image_0=image_0,
+                image_1=image_1,
+                mask=needs_full_search,
+                disparity_range=self.disparity_range,
+                block_size=self.block_size,
+                subpixel_fit=self.subpixel_fit,
+                cost_function=self.cost_function,
+            )[needs_full_search]
+
+        invalid_age = np.where(is_known_invalid, invalid_age + 1, -1).astype(np.int32)
+        invalid_age[needs_full_search & np.isnan(disparity)] = 0
+        return disparity, invalid_age
+
+    def match(
+        self,
+        image_0: NDArray[Shape["H, W"], Number],
+        image_1: NDArray[Shape["H, W"], Number],
+    ) -> NDArray[Shape["H, W"], Float32]:
+        if (
+            self.previous_disparity is None
+            or self.invalid_age is None
+            or self.previous_disparity.shape != image_0.shape[:2]
+        ):
+            disparity = self._full_search(image_0=image_0, image_1=image_1)
+            invalid_age = np.where(np.isnan(disparity), 0, -1).astype(np.int32)
+        else:
+            disparity, invalid_age = self._warm_start_search(
+                image_0=image_0,
+                image_1=image_1,
+                previous_disparity=self.previous_disparity,
+                invalid_age=self.invalid_age,
+            )
+
+        self.previous_disparity = disparity.copy()
+        self.invalid_age = invalid_age
+        return disparity
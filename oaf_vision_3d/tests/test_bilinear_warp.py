@@ -0,0 +1,39 @@
+import numpy as np
+from scipy.ndimage import map_coordinates
+
+from oaf_vision_3d.bilinear_warp import bilinear_warp
+
+
+def test_bilinear_warp() -> None:
+    rng = np.random.default_rng(0)
+    image = rng.random((40, 50, 3), dtype=np.float32)
+    pixels = (
+        np.indices((30, 70), dtype=np.float32)[::-1].transpose(1, 2, 0) * 0.8
+        + rng.normal(0.0, 2.0, (30, 70, 2)).astype(np.float32)
+        - 2.0
+    )
+    pixels[0, :4] = [[0.0, 0.0], [49.0, 39.0], [49.0 + 1e-3, 5.0], [np.nan, 5.0]]
+
+    expected = np.stack(
+        [
+            map_coordinates(
+                input=_image,
+                coordinates=[pixels[..., 1], pixels[..., 0]],
+                order=1,
+                mode="constant",
+                cval=np.nan,
+            )
+            for _image in image.transpose(2, 0, 1)
+        ],
+        axis=-1,
+    )
+
+    warped = bilinear_warp(image=image, pixels=pixels)
+    assert warped.shape == (30, 70, 3)
+    assert np.allclose(warped, expected, atol=1e-6, equal_nan=True)
+    assert np.allclose(
+        bilinear_warp(image=image[..., 0], pixels=pixels),
+        expected[..., 0],
+        atol=1e-6,
+        equal_nan=True,
+    )
@@ -0,0 +1,411 @@
+import numpy as np
+from nptyping import Float32, NDArray, Shape
+from scipy.ndimage import gaussian_filter
+from scipy.signal import convolve2d
+
+from oaf_vision_3d.block_matching import Aggregation, CostFunction, block_matching
+from oaf_vision_3d.box_filter import box_filter
+from oaf_vision_3d.pyramid_block_matching import pyramid_block_matching
+from oaf_vision_3d.semi_global_matching import SemiGlobalMatchingParameters
+from oaf_vision_3d.sparse_block_matching import (
+    masked_block_matching,
+    sparse_block_matching,
+)
+from oaf_vision_3d.stereo_matcher import StereoMatcher
+
+
+def _stereo_pair(
+    shape: tuple[int, int] = (60, 120), disparity: int = 7
+) -> tuple[NDArray[Shape["H, W, 3"], Float32], NDArray[Shape["H, W, 3"], Float32]]:
+    rng = np.random.default_rng(42)
+    texture = gaussian_filter(
+        rng.random((shape[0], shape[1] + disparity, 3), dtype=np.float32),
+        sigma=(1.0, 1.0, 0.0),
+    )
+    return texture[:, : shape[1]], texture[:, disparity:]
+
+
+def test_box_filter() -> None:
+    values = np.random.default_rng(0).random((3, 40, 50), dtype=np.float32)
+    values[1, 20, 30] = np.nan
+    for block_size in [(1, 1), (2, 3), (4, 4), (11, 7)]:
+        expected = np.array(
+            [
+                convolve2d(
+                    convolve2d(
+                        _values,
+                        np.ones((1, block_size[0])) / block_size[0],
+                        mode="same",
+                    ),
+                    np.ones((block_size[1], 1)) / block_size[1],
+                    mode="same",
+                )
+                for _values in values
+            ]
+        )
+        assert np.allclose(
+            box_filter(values=values, block_size=np.array(block_size)),
+            expected,
+            atol=1e-6,
+            equal_nan=True,
+        )
+
+
+def test_block_matching_aggregation() -> None:
+    image_0, image_1 = _stereo_pair()
+    disparity_range = np.array([0, 20], dtype=np.float32)
+
+    disparity = block_matching(
+        image_0=image_0,
+        image_1=image_1,
+        disparity_range=disparity_range,
+        aggregation=Aggregation.CONVOLVE_2D,
+    )
+    disparity_summed_area_table = block_matching(
+        image_0=image_0,
+        image_1=image_1,
+        disparity_range=disparity_range,
+        aggregation=Aggregation.SUMMED_AREA_TABLE,
+    )
+
+    assert np.allclose(disparity[:, 30:-30], 7.0, atol=0.05)
+    assert np.allclose(
+        disparity, disparity_summed_area_table, atol=1e-4, equal_nan=True
+    )
+
+
+def test_block_matching_streaming() -> None:
+    image_0, image_1 = _stereo_pair()
+    image_1 = image_1 + 0.05 * np.random.default_rng(1).random(
+        image_1.shape, dtype=np.float32
+    )
+    disparity_range = np.array([-3, 20], dtype=np.float32)
+
+    for aggregation in Aggregation:
+        for subpixel_fit in [True, False]:
+            disparity = block_matching(
+                image_0=image_0,
+                image_1=image_1,
+                disparity_range=disparity_range,
+                subpixel_fit=subpixel_fit,
+                aggregation=aggregation,
+            )
+            disparity_streaming = block_matching(
+                image_0=image_0,
+                image_1=image_1,
+                disparity_range=disparity_range,
+                subpixel_fit=subpixel_fit,
+                aggregation=aggregation,
+                streaming=True,
+            )
+            assert np.array_equal(disparity, disparity_streaming, equal_nan=True)
+
+
+def test_block_matching_workers() -> None:
+    image_0, image_1 = _stereo_pair(shape=(83, 120))
+    disparity_range = np.array([0, 20], dtype=np.float32)
+
+    for aggregation in Aggregation:
+        disparity = block_matching(
+            image_0=image_0,
+            image_1=image_1,
+            disparity_range=disparity_range,
+            aggregation=aggregation,
+        )
+        disparity_tiled = block_matching(
+            image_0=image_0,
+            image_1=image_1,
+            disparity_range=disparity_range,
+            aggregation=aggregation,
+            workers=3,
+        )
+        assert np.array_equal(disparity, disparity_tiled, equal_nan=True)
+
+
+def test_block_matching_uint8() -> None:
+    image_0, image_1 = _stereo_pair()
+    image_0 = np.round(image_0 * 255).astype(np.uint8)
+    image_1 = np.round(image_1 * 255).astype(np.uint8)
+    disparity_range = np.array([0, 20], dtype=np.float32)
+
+    for cost_function in [
+        CostFunction.SUM_OF_ABSOLUTE_DIFFERENCE,
+        CostFunction.SUM_OF_SQUARED_DIFFERENCE,
+    ]:
+        for aggregation in Aggregation:
+            disparity = block_matching(
+                image_0=image_0.astype(np.float32) / 255,
+                image_1=image_1.astype(np.float32) / 255,
+                disparity_range=disparity_range,
+                cost_function=cost_function,
+                aggregation=aggregation,
+            )
+            disparity_uint8 = block_matching(
+                image_0=image_0,
+                image_1=image_1,
+                disparity_range=disparity_range,
+                cost_function=cost_function,
+                aggregation=aggregation,
+            )
+            assert np.allclose(disparity, disparity_uint8, atol=1e-4, equal_nan=True)
+
+    disparity_grayscale = block_matching(
+        image_0=np.round(image_0.mean(axis=-1)).astype(np.uint8),
+        image_1=np.round(image_1.mean(axis=-1)).astype(np.uint8),
+        disparity_range=disparity_range,
+    )
+    assert np.allclose(disparity_grayscale[:, 30:-30], 7.0, atol=0.1)
+
+
+def test_pyramid_block_matching() -> None:
+    image_0, image_1 = _stereo_pair(shape=(64, 200), disparity=23)
+    disparity_range = np.array([0, 48], dtype=np.float32)
+
+    disparity = block_matching(
+        image_0=image_0, image_1=image_1, disparity_range=disparity_range
+    )
+    disparity_pyramid = pyramid_block_matching(
+        image_0=image_0,
+        image_1=image_1,
+        disparity_range=disparity_range,
+        number_of_levels=2,
+    )
+
+    assert np.allclose(disparity, disparity_pyramid, atol=1e-4, equal_nan=True)
+
+
+def test_pyramid_block_matching_uint8() -> None:
+    image_0, image_1 = _stereo_pair(shape=(64, 200), disparity=23)
+    image_0 = np.round(image_0 * 255).astype(np.uint8)
+    image_1 = np.round(image_1 * 255).astype(np.uint8)
+    disparity_range = np.array([0, 48], dtype=np.float32)
+
+    disparity = block_matching(
+        image_0=image_0, image_1=image_1, disparity_range=disparity_range
+    )
+    disparity_pyramid = pyramid_block_matching(
+        image_0=image_0,
+        image_1=image_1,
+        disparity_range=disparity_range,
+        number_of_levels=2,
+    )
+
+    assert np.allclose(disparity, disparity_pyramid, atol=1e-4, equal_nan=True)
+
+
+def test_block_matching_census() -> None:
+    image_0, image_1 = _stereo_pair(shape=(64, 160), disparity=11)
+    image_1 = 1.3 * image_1 + 0.1
+    disparity_range = np.array([0, 30], dtype=np.float32)
+
+    disparity = block_matching(
+        image_0=image_0,
+        image_1=image_1,
+        disparity_range=disparity_range,
+        cost_function=CostFunction.CENSUS,
+    )
+    disparity_tiled = block_matching(
+        image_0=image_0,
+        image_1=image_1,
+        disparity_range=disparity_range,
+        cost_function=CostFunction.CENSUS,
+        workers=3,
+    )
+
+    assert np.nanmedian(np.abs(disparity - 11.0)) < 0.1
+    assert np.array_equal(disparity, disparity_tiled, equal_nan=True)
+
+
+def test_block_matching_semi_global_matching() -> None:
+    image_0, image_1 = _stereo_pair(shape=(64, 160), disparity=11)
+    image_1 = image_1 + 0.08 * np.random.default_rng(3).standard_normal(
+        image_1.shape, dtype=np.float32
+    )
+    disparity_range = np.array([0, 30], dtype=np.float32)
+    block_size = np.array([3, 3], dtype=np.int32)
+
+    disparity = block_matching(
+        image_0=image_0,
+        image_1=image_1,
+        disparity_range=disparity_range,
+        block_size=block_size,
+    )
+    disparity_semi_global_matching = block_matching(
+        image_0=image_0,
+        image_1=image_1,
+        disparity_range=disparity_range,
+        block_size=block_size,
+        semi_global_matching_parameters=SemiGlobalMatchingParameters(
+            penalty_1=0.05, penalty_2=0.3
+        ),
+    )
+
+    outliers = np.nanmean(np.abs(disparity - 11.0) > 1.0)
+    outliers_semi_global_matching = np.nanmean(
+        np.abs(disparity_semi_global_matching - 11.0) > 1.0
+    )
+    assert outliers_semi_global_matching < 0.1 * outliers
+
+
+def test_block_matching_semi_global_matching_uint8() -> None:
+    image_0, image_1 = _stereo_pair(shape=(64, 160), disparity=11)
+    image_1 = image_1 + 0.08 * np.random.default_rng(3).standard_normal(
+        image_1.shape, dtype=np.float32
+    )
+    images = [
+        np.round(np.clip(image, 0.0, 1.0) * 255).astype(np.uint8)
+        for image in [image_0, image_1]
+    ]
+
+    for cost_function in [
+        CostFunction.SUM_OF_ABSOLUTE_DIFFERENCE,
+        CostFunction.SUM_OF_SQUARED_DIFFERENCE,
+    ]:
+        disparity_uint8, disparity_float32 = (
+            block_matching(
+                image_0=_image_0,
+                image_1=_image_1,
+                disparity_range=np.array([0, 30], dtype=np.float32),
+                block_size=np.array([3, 3], dtype=np.int32),
+                cost_function=cost_function,
+                subpixel_fit=False,
+                semi_global_matching_parameters=SemiGlobalMatchingParameters(
+                    penalty_1=0.05, penalty_2=0.3
+                ),
+            )
+            for _image_0, _image_1 in [
+                images,
+                [image.astype(np.float32) / 255 for image in images],
+            ]
+        )
+        is_equal = (disparity_uint8 == disparity_float32) | (
+            np.isnan(disparity_uint8) & np.isnan(disparity_float32)
+        )
+        assert is_equal.mean() > 0.99
+
+
+def test_block_matching_left_right_consistency() -> None:
+    rng = np.random.default_rng(0)
+    image_0, image_1 = [
+        gaussian_filter(rng.random((60, 160, 3), dtype=np.float32), (1.0, 1.0, 0.0))
+        for _ in range(2)
+    ]
+    image_1[:, :-5] = image_0[:, 5:]
+    image_1[20:40, 50:90] = image_0[20:40, 65:105]
+    occluded = np.zeros(image_0.shape[:2], dtype=bool)
+    occluded[20:40, 55:65] = True
+    disparity_range = np.array([0, 24], dtype=np.float32)
+
+    disparity = block_matching(
+        image_0=image_0,
+        image_1=image_1,
+        disparity_range=disparity_range,
+        left_right_threshold=1.0,
+    )
+    disparity_streaming = block_matching(
+        image_0=image_0,
+        image_1=image_1,
+        disparity_range=disparity_range,
+        left_right_threshold=1.0,
+        streaming=True,
+    )
+
+    assert np.array_equal(disparity, disparity_streaming, equal_nan=True)
+    assert np.isnan(disparity[occluded]).mean() > 0.8
+    assert np.isnan(disparity[30:, 30:-30]).mean() < 0.05
+
+
+def test_sparse_block_matching() -> None:
+    image_0, image_1 = _stereo_pair(shape=(60, 160), disparity=9)
+    disparity_range = np.array([0, 24], dtype=np.float32)
+    pixels = np.array([[0, 0], [159, 59], [30, 2], [80, 30], [120, 57]])
+
+    disparity = block_matching(
+        image_0=image_0, image_1=image_1, disparity_range=disparity_range
+    )
+    disparity_sparse = sparse_block_matching(
+        image_0=image_0,
+        image_1=image_1,
+        pixels=pixels,
+        disparity_range=disparity_range,
+    )
+
+    assert np.allclose(
+        disparity[pixels[:, 1], pixels[:, 0]],
+        disparity_sparse,
+        atol=1e-4,
+        equal_nan=True,
+    )
+
+
+def test_masked_block_matching() -> None:
+    image_0, image_1 = _stereo_pair(shape=(60, 200), disparity=9)
+    disparity_range = np.array([0, 24], dtype=np.float32)
+
+    for cost_function in [CostFunction.SUM_OF_ABSOLUTE_DIFFERENCE, CostFunction.CENSUS]:
+        disparity = block_matching(
+            image_0=image_0,
+            image_1=image_1,
+            disparity_range=disparity_range,
+            cost_function=cost_function,
+        )
+        for rows, columns in [(slice(20, 40), slice(80, 120)), ([5, 50], [30, 170])]:
+            mask = np.zeros(disparity.shape, dtype=bool)
+            mask[rows, columns] = True
+            disparity_masked = masked_block_matching(
+                image_0=image_0,
+                image_1=image_1,
+                mask=mask,
+                disparity_range=disparity_range,
+                cost_function=cost_function,
+            )
+            assert np.isnan(disparity_masked[~mask]).all()
+            assert np.allclose(
+                disparity_masked[mask], disparity[mask], atol=1e-4, equal_nan=True
+            )
+
+
+def test_stereo_matcher() -> None:
+    stereo_matcher = StereoMatcher(
+        disparity_range=np.array([0, 32], dtype=np.float32), maximum_cost=0.1
+    )
+
+    for frame_disparity in [9, 10, 10, 17]:
+        image_0, image_1 = _stereo_pair(shape=(60, 160), disparity=frame_disparity)
+        disparity = stereo_matcher.match(image_0=image_0, image_1=image_1)
+        expected_disparity = block_matching(
+            image_0=image_0,
+            image_1=image_1,
+            disparity_range=stereo_matcher.disparity_range,
+        )
+        assert np.allclose(disparity, expected_disparity, atol=0.25, equal_nan=True)
+
+
+def test_stereo_matcher_invalid_regions() -> None:
+    stereo_matcher = StereoMatcher(
+        disparity_range=np.array([0, 32], dtype=np.float32), maximum_cost=0.1
+    )
+    is_near_region = np.zeros((60, 160), dtype=bool)
+    is_near_region[5:55, 45:115] = True
+
+    for frame, frame_disparity in enumerate([9, 10, 10, 11]):
+        image_0, image_1 = _stereo_pair(shape=(60, 160), disparity=frame_disparity)
+        image_0[10:50, 50:110] = 0.5
+        image_1[10:50, 50 - frame_disparity : 110 - frame_disparity] = 0.5
+
+        disparity = stereo_matcher.match(image_0=image_0, image_1=image_1)
+        expected_disparity = block_matching(
+            image_0=image_0,
+            image_1=image_1,
+            disparity_range=stereo_matcher.disparity_range,
+        )
+        assert np.allclose(
+            disparity[~is_near_region],
+            expected_disparity[~is_near_region],
+            atol=0.25,
+            equal_nan=True,
+        )
+        assert np.isnan(expected_disparity[20:40, 60:90]).all()
+        assert np.isnan(disparity[20:40, 60:90]).all()
+        assert stereo_matcher.invalid_age is not None
+        assert (stereo_matcher.invalid_age[20:40, 60:90] == frame).all()
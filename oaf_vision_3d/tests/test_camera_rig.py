@@ -0,0 +1,95 @@
+from pathlib import Path
+
+import numpy as np
+
+from oaf_vision_3d.camera_rig import CameraRig
+from oaf_vision_3d.lens_model import CameraMatrix, DistortionCoefficients, LensModel
+from oaf_vision_3d.project_points import project_points
+from oaf_vision_3d.transformation_matrix import TransformationMatrix
+
+
+def test_camera_rig(tmp_path: Path) -> None:
+    rng = np.random.default_rng(0)
+    lens_models = [
+        LensModel(
+            camera_matrix=CameraMatrix(
+                fx=500.0 + index, fy=510.0, cx=320.0, cy=240.0 - index
+            ),
+            distortion_coefficients=DistortionCoefficients(
+                k1=0.1 * index, p1=0.01, tau_y=0.01 * index
+            ),
+        )
+        for index in range(3)
+    ]
+    transformation_matrices = [
+        TransformationMatrix.from_rvec_and_tvec(
+            rvec=rng.normal(0.0, 0.1, 3).astype(np.float32),
+            tvec=rng.normal(0.0, 5.0, 3).astype(np.float32),
+        )
+        for _ in range(3)
+    ]
+    camera_rig = CameraRig.from_cameras(
+        lens_models=lens_models, transformation_matrices=transformation_matrices
+    )
+    assert len(camera_rig) == 3
+    assert camera_rig.lens_models() == lens_models
+
+    pixels = rng.uniform(0.0, 640.0, (3, 10, 12, 2)).astype(np.float32)
+    normalized_pixels = camera_rig.normalize_pixels(pixels=pixels)
+    undistorted_normalized_pixels = camera_rig.undistort_pixels(
+        normalized_pixels=normalized_pixels
+    )
+    for index, lens_model in enumerate(lens_models):
+        assert np.array_equal(
+            normalized_pixels[index], lens_model.normalize_pixels(pixels=pixels[index])
+        )
+        assert np.allclose(
+            undistorted_normalized_pixels[index],
+            lens_model.undistort_pixels(normalized_pixels=normalized_pixels[index]),
+            atol=1e-6,
+        )
+        assert np.allclose(
+            camera_rig.distort_pixels(normalized_pixels=normalized_pixels)[index],
+            lens_model.distort_pixels(normalized_pixels=normalized_pixels[index]),
+            atol=1e-6,
+        )
+    assert np.allclose(
+        camera_rig.denormalize_pixels(
+            pixels=camera_rig.distort_pixels(
+                normalized_pixels=undistorted_normalized_pixels
+            )
+        ),
+        pixels,
+        atol=1e-2,
+    )
+
+    points = np.concatenate(
+        [rng.uniform(-20.0, 20.0, (50, 2)), rng.uniform(80.0, 100.0, (50, 1))],
+        axis=-1,
+    ).astype(np.float32)
+    assert np.allclose(
+        camera_rig.project_points(points=points),
+        [
+            project_points(
+                points=points,
+                lens_model=lens_model,
+                transformation_matrix=transformation_matrix.inverse(),
+            )
+            for lens_model, transformation_matrix in zip(
+                lens_models, transformation_matrices
+            )
+        ],
+        atol=1e-3,
+    )
+    assert np.allclose(
+        camera_rig.transformation_matrix(2, reference=1).as_matrix(),
+        transformation_matrices[1].inverse().as_matrix()
+        @ transformation_matrices[2].as_matrix(),
+        atol=1e-5,
+    )
+
+    camera_rig.save(tmp_path / "camera_rig.npz")
+    loaded_camera_rig = CameraRig.load(tmp_path / "camera_rig.npz")
+    assert loaded_camera_rig.lens_models() == lens_models
+    assert np.array_equal(loaded_camera_rig.rotations, camera_rig.rotations)
+    assert np.array_equal(loaded_camera_rig.translations, camera_rig.translations)
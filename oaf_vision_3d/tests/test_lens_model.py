@@ -0,0 +1,183 @@
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+from oaf_vision_3d.lens_model import (
+    CameraMatrix,
+    DistortionCoefficients,
+    LensModel,
+    UndistortionMethod,
+)
+from test_data.data_paths import DataPaths
+
+
+@pytest.mark.parametrize(
+    "lens_model",
+    [
+        LensModel.read_from_json(DataPaths.distorted_checkerboard_lens_model),
+        LensModel.read_from_json(DataPaths.distorted_house_lens_model),
+        LensModel(
+            camera_matrix=CameraMatrix(fx=500.0, fy=520.0, cx=320.0, cy=240.0),
+            distortion_coefficients=DistortionCoefficients(
+                k1=0.1,
+                k2=-0.05,
+                k3=0.01,
+                k4=0.05,
+                k5=0.01,
+                k6=-0.002,
+                p1=0.01,
+                p2=-0.005,
+                s1=0.003,
+                s2=-0.002,
+                s3=0.004,
+                s4=0.001,
+                tau_x=0.02,
+                tau_y=-0.03,
+            ),
+        ),
+    ],
+)
+def test_distort_pixels(lens_model: LensModel) -> None:
+    rng = np.random.default_rng(0)
+    normalized_pixels = rng.uniform(-0.6, 0.6, (40, 50, 2)).astype(np.float32)
+
+    expected, _ = cv2.projectPoints(
+        np.concatenate(
+            [normalized_pixels, np.ones((40, 50, 1), dtype=np.float32)], axis=-1
+        ).reshape(-1, 3),
+        np.zeros(3),
+        np.zeros(3),
+        lens_model.camera_matrix.as_matrix(),
+        lens_model.distortion_coefficients.as_opencv_vector(),
+    )
+    distorted_pixels, jacobian = lens_model.distort_pixels_with_jacobian(
+        normalized_pixels=normalized_pixels
+    )
+    assert np.allclose(
+        lens_model.denormalize_pixels(pixels=distorted_pixels),
+        expected.reshape(40, 50, 2),
+        atol=1e-3,
+    )
+    assert np.array_equal(
+        lens_model.distort_pixels(normalized_pixels=normalized_pixels),
+        distorted_pixels,
+    )
+
+    epsilon = 1e-3
+    for axis in range(2):
+        step = np.zeros(2, dtype=np.float64)
+        step[axis] = epsilon
+        finite_difference = (
+            lens_model.distort_pixels(normalized_pixels=normalized_pixels + step)
+            - lens_model.distort_pixels(normalized_pixels=normalized_pixels - step)
+        ) / (2 * epsilon)
+        assert np.allclose(jacobian[..., axis], finite_difference, atol=1e-5)
+
+
+def test_undistort_pixels() -> None:
+    pixels = np.indices((302, 574), dtype=np.float32)[::-1].transpose(1, 2, 0)
+
+    lens_model = LensModel.read_from_json(DataPaths.distorted_house_lens_model)
+    undistorted_normalized_pixels = lens_model.undistort_pixels(
+        normalized_pixels=lens_model.normalize_pixels(pixels=pixels),
+        method=UndistortionMethod.NEWTON,
+    )
+    assert np.allclose(
+        lens_model.denormalize_pixels(
+            pixels=lens_model.distort_pixels(
+                normalized_pixels=undistorted_normalized_pixels
+            )
+        ),
+        pixels,
+        atol=1e-3,
+    )
+
+    lens_model.distortion_coefficients = DistortionCoefficients(k1=0.05, p1=0.001)
+    normalized_pixels = lens_model.normalize_pixels(pixels=pixels)
+    assert np.allclose(
+        lens_model.undistort_pixels(
+            normalized_pixels=normalized_pixels, method=UndistortionMethod.NEWTON
+        ),
+        lens_model.undistort_pixels(
+            normalized_pixels=normalized_pixels, method=UndistortionMethod.FIXED_POINT
+        ),
+        atol=1e-5,
+    )
+
+
+def test_undistortion_map(tmp_path: Path) -> None:
+    lens_model = LensModel.read_from_json(DataPaths.distorted_house_lens_model)
+    new_camera_matrix = CameraMatrix(fx=200.0, fy=200.0, cx=290.0, cy=150.0)
+
+    undistortion_map = lens_model.undistortion_map(
+        shape=(302, 574), new_camera_matrix=new_camera_matrix, cache_dir=tmp_path
+    )
+    pixels = np.indices((302, 574), dtype=np.float32)[::-1].transpose(1, 2, 0)
+    assert np.allclose(
+        undistortion_map,
+        lens_model.denormalize_pixels(
+            pixels=lens_model.distort_pixels(
+                normalized_pixels=(pixels - [290.0, 150.0]) / 200.0
+            )
+        ),
+        atol=1e-3,
+    )
+    assert not undistortion_map.flags.writeable
+
+    assert (
+        LensModel.from_dict(lens_model.to_dict()).undistortion_map(
+            shape=(302, 574), new_camera_matrix=new_camera_matrix
+        )
+        is undistortion_map
+    )
+    assert lens_model.undistortion_map(shape=(302, 574)) is not undistortion_map
+
+    (file_path,) = tmp_path.glob("undistortion_map_*.npy")
+    assert np.array_equal(np.load(file_path), undistortion_map)
+
+
+def test_lens_model_out() -> None:
+    lens_model = LensModel(
+        camera_matrix=CameraMatrix(fx=500.0, fy=520.0, cx=320.0, cy=240.0),
+        distortion_coefficients=DistortionCoefficients(
+            k1=0.1, k2=-0.05, p1=0.01, tau_x=0.02
+        ),
+    )
+    pixels = (
+        np.random.default_rng(0).uniform(0.0, 640.0, (40, 50, 2)).astype(np.float32)
+    )
+
+    normalized_pixels = lens_model.normalize_pixels(pixels=pixels)
+    for method in UndistortionMethod:
+        undistorted_normalized_pixels = lens_model.undistort_pixels(
+            normalized_pixels=normalized_pixels, method=method
+        )
+        distorted_pixels = lens_model.denormalize_pixels(
+            pixels=lens_model.distort_pixels(
+                normalized_pixels=undistorted_normalized_pixels
+            )
+        )
+
+        buffer = pixels.copy()
+        lens_model.normalize_pixels(pixels=buffer, out=buffer)
+        assert np.array_equal(buffer, normalized_pixels)
+        lens_model.undistort_pixels(normalized_pixels=buffer, method=method, out=buffer)
+        assert np.array_equal(buffer, undistorted_normalized_pixels)
+        lens_model.distort_pixels(normalized_pixels=buffer, out=buffer)
+        assert lens_model.denormalize_pixels(pixels=buffer, out=buffer) is buffer
+        assert np.array_equal(buffer, distorted_pixels)
+
+
+def test_camera_matrix_vectors() -> None:
+    camera_matrix = CameraMatrix(fx=500.0, fy=520.0, cx=320.0, cy=240.0)
+    focal_length = camera_matrix.focal_length()
+    assert camera_matrix.focal_length() is focal_length
+    assert not focal_length.flags.writeable
+
+    camera_matrix.fx = 600.0
+    camera_matrix.cy = 250.0
+    assert np.array_equal(camera_matrix.focal_length(), [600.0, 520.0])
+    assert np.array_equal(camera_matrix.principal_point(), [320.0, 250.0])
+    assert camera_matrix == CameraMatrix(fx=600.0, fy=520.0, cx=320.0, cy=250.0)
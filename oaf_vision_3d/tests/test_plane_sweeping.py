@@ -0,0 +1,308 @@
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Event
+from typing import Any
+
+import numpy as np
+import pytest
+from nptyping import Float32, NDArray, Shape
+from scipy.ndimage import gaussian_filter
+
+from oaf_vision_3d.bilinear_warp import bilinear_warp
+from oaf_vision_3d.camera_rig import CameraRig
+from oaf_vision_3d.lens_model import CameraMatrix, DistortionCoefficients, LensModel
+from oaf_vision_3d.plane_sweeping import (
+    DepthSampling,
+    PlaneSweepingEngine,
+    PlaneSweepingRig,
+    plane_sweeping,
+    plane_sweeping_with_camera_rig,
+)
+from oaf_vision_3d.transformation_matrix import TransformationMatrix
+
+_FOCAL_LENGTH = 100.0
+_BASELINE = 7.0
+
+
+@dataclass
+class _PlaneSweepingScene:
+    image: NDArray[Shape["H, W, 3"], Float32]
+    lens_model: LensModel
+    secondary_image: NDArray[Shape["H, W, 3"], Float32]
+    secondary_lens_model: LensModel
+    transformation_matrix: TransformationMatrix
+
+    def plane_sweeping(self, **overrides: Any) -> NDArray[Shape["H, W, 3"], Float32]:
+        parameters: dict[str, Any] = {
+            "image": self.image,
+            "lens_model": self.lens_model,
+            "secondary_images": [self.secondary_image],
+            "secondary_lens_models": [self.secondary_lens_model],
+            "secondary_transformation_matrices": [self.transformation_matrix],
+            "depth_range": np.array([80.0, 125.0], dtype=np.float32),
+            "step_size": 1.0,
+            "block_size": 5,
+        }
+        return plane_sweeping(**(parameters | overrides))
+
+
+def _plane_sweeping_scene(
+    shape: tuple[int, int] = (60, 120),
+    depth: float = 100.0,
+    distortion_coefficients: DistortionCoefficients = DistortionCoefficients(),
+) -> _PlaneSweepingScene:
+    disparity = _FOCAL_LENGTH * _BASELINE / depth
+    margin = 16
+    rng = np.random.default_rng(42)
+    texture = gaussian_filter(
+        rng.random(
+            (shape[0] + 2 * margin, shape[1] + int(np.ceil(disparity)) + 2 * margin, 3),
+            dtype=np.float32,
+        ),
+        sigma=(2.0, 2.0, 0.0),
+    )
+    lens_model = LensModel(
+        camera_matrix=CameraMatrix(
+            fx=_FOCAL_LENGTH, fy=_FOCAL_LENGTH, cx=shape[1] / 2, cy=shape[0] / 2
+        ),
+        distortion_coefficients=distortion_coefficients,
+    )
+    texels = lens_model.denormalize_pixels(
+        pixels=lens_model.undistort_pixels(
+            normalized_pixels=lens_model.normalize_pixels(
+                pixels=np.indices(shape, dtype=np.float32)[::-1].transpose((1, 2, 0))
+            )
+        )
+    ) + np.float32(margin)
+    return _PlaneSweepingScene(
+        image=bilinear_warp(image=texture, pixels=texels),
+        lens_model=lens_model,
+        secondary_image=bilinear_warp(
+            image=texture, pixels=texels + np.array([disparity, 0.0], dtype=np.float32)
+        ),
+        secondary_lens_model=lens_model,
+        transformation_matrix=TransformationMatrix(
+            translation=np.array([_BASELINE, 0.0, 0.0], dtype=np.float32)
+        ),
+    )
+
+
+def test_plane_sweeping_engines() -> None:
+    for distortion_coefficients, atol in [
+        (DistortionCoefficients(), 0.5),
+        (DistortionCoefficients(k1=0.1, k2=-0.05, p1=0.005), 1.0),
+    ]:
+        scene = _plane_sweeping_scene(distortion_coefficients=distortion_coefficients)
+
+        xyz = {
+            engine: scene.plane_sweeping(engine=engine)[10:-10, 20:-20]
+            for engine in PlaneSweepingEngine
+        }
+
+        assert np.allclose(
+            xyz[PlaneSweepingEngine.HOMOGRAPHY][..., 2], 100.0, atol=atol
+        )
+        assert np.allclose(
+            xyz[PlaneSweepingEngine.HOMOGRAPHY],
+            xyz[PlaneSweepingEngine.REPROJECTION],
+            atol=1e-3,
+            equal_nan=True,
+        )
+
+
+def test_plane_sweeping_workers() -> None:
+    scene = _plane_sweeping_scene()
+
+    for subpixel_fit in [True, False]:
+        xyz = [
+            scene.plane_sweeping(
+                secondary_images=[
+                    scene.secondary_image,
+                    scene.secondary_image[:, ::-1],
+                ],
+                secondary_lens_models=[scene.secondary_lens_model] * 2,
+                secondary_transformation_matrices=[scene.transformation_matrix] * 2,
+                depth_range=np.array([90.0, 105.0], dtype=np.float32),
+                subpixel_fit=subpixel_fit,
+                workers=workers,
+            )
+            for workers in [1, 3, 7]
+        ]
+
+        assert np.array_equal(xyz[0], xyz[1], equal_nan=True)
+        assert np.array_equal(xyz[0], xyz[2], equal_nan=True)
+
+
+def test_plane_sweeping_rig(tmp_path: Path) -> None:
+    scene = _plane_sweeping_scene()
+    height, width = scene.image.shape[:2]
+    depth_range = np.array([90.0, 105.0], dtype=np.float32)
+    rig = PlaneSweepingRig.from_cameras(
+        lens_model=scene.lens_model,
+        secondary_lens_models=[scene.secondary_lens_model],
+        secondary_transformation_matrices=[scene.transformation_matrix],
+        shape=(height, width),
+        cache_warps=True,
+    )
+
+    for engine in PlaneSweepingEngine:
+        xyz = [
+            scene.plane_sweeping(depth_range=depth_range, engine=engine, rig=_rig)
+            for _rig in [None, rig, rig]
+        ]
+        assert np.array_equal(xyz[0], xyz[1], equal_nan=True)
+        assert np.array_equal(xyz[0], xyz[2], equal_nan=True)
+    assert len(rig.warps) == 2 * 16
+
+    rig.save(tmp_path / "rig.npz")
+    loaded_rig = PlaneSweepingRig.load(tmp_path / "rig.npz")
+    assert loaded_rig.matches(
+        lens_model=scene.lens_model,
+        secondary_lens_models=[scene.secondary_lens_model],
+        secondary_transformation_matrices=[scene.transformation_matrix],
+        shape=(height, width),
+    )
+    assert rig.warps.keys() == loaded_rig.warps.keys()
+    for engine in PlaneSweepingEngine:
+        assert np.array_equal(
+            scene.plane_sweeping(
+                depth_range=depth_range, engine=engine, rig=loaded_rig
+            ),
+            scene.plane_sweeping(depth_range=depth_range, engine=engine),
+            equal_nan=True,
+        )
+
+    with pytest.raises(ValueError):
+        scene.plane_sweeping(
+            image=scene.image[:-1],
+            secondary_images=[scene.secondary_image[:-1]],
+            depth_range=depth_range,
+            rig=rig,
+        )
+
+
+def test_plane_sweeping_depth_sampling() -> None:
+    scene = _plane_sweeping_scene()
+
+    xyz = scene.plane_sweeping(depth_sampling=DepthSampling.UNIFORM)
+    assert np.array_equal(
+        scene.plane_sweeping(
+            depth_sampling=DepthSampling.UNIFORM, coarse_to_fine_factor=4
+        )[10:-10, 20:-20],
+        xyz[10:-10, 20:-20],
+        equal_nan=True,
+    )
+    for coarse_to_fine_factor in [1, 4]:
+        assert np.allclose(
+            scene.plane_sweeping(
+                depth_sampling=DepthSampling.INVERSE_DEPTH,
+                coarse_to_fine_factor=coarse_to_fine_factor,
+            )[10:-10, 20:-20, 2],
+            100.0,
+            atol=0.5,
+        )
+
+
+def test_plane_sweeping_subpixel_fit() -> None:
+    depth = _FOCAL_LENGTH * _BASELINE / 4.5
+    scene = _plane_sweeping_scene(depth=depth)
+
+    for depth_sampling in DepthSampling:
+        xyz = scene.plane_sweeping(
+            depth_range=np.array([80.0, 250.0], dtype=np.float32),
+            depth_sampling=depth_sampling,
+        )[10:-10, 20:-20]
+
+        assert np.median(np.abs(xyz[..., 2] - depth)) < 1.0
+
+
+def test_plane_sweeping_best_k() -> None:
+    scene = _plane_sweeping_scene()
+    occluded_image = scene.secondary_image.copy()
+    occluded_image[:, 40:80] = np.random.default_rng(3).random(
+        (60, 40, 3), dtype=np.float32
+    )
+
+    xyz = {
+        best_k: scene.plane_sweeping(
+            secondary_images=[scene.secondary_image, occluded_image],
+            secondary_lens_models=[scene.secondary_lens_model] * 2,
+            secondary_transformation_matrices=[scene.transformation_matrix] * 2,
+            best_k=best_k,
+        )[10:-10, 20:-20]
+        for best_k in [None, 1]
+    }
+
+    assert not np.allclose(xyz[None][..., 2], 100.0, atol=0.5, equal_nan=True)
+    assert np.allclose(xyz[1][..., 2], 100.0, atol=0.5)
+
+
+def test_plane_sweeping_progress() -> None:
+    scene = _plane_sweeping_scene()
+    coarse_to_fine = {
+        "step_size": 0.5,
+        "coarse_to_fine_factor": 2,
+        "coarse_to_fine_rounds": 3,
+    }
+
+    progress: list[NDArray[Shape["H, W, 3"], Float32]] = []
+    xyz = scene.plane_sweeping(**coarse_to_fine, progress_callback=progress.append)
+    assert len(progress) == 3
+    assert np.array_equal(progress[-1], xyz, equal_nan=True)
+    assert np.allclose(xyz[10:-10, 20:-20, 2], 100.0, atol=0.5)
+
+    assert np.array_equal(
+        scene.plane_sweeping(**coarse_to_fine, time_budget=0.0),
+        progress[0],
+        equal_nan=True,
+    )
+
+    cancel_event = Event()
+    cancelled_progress: list[NDArray[Shape["H, W, 3"], Float32]] = []
+
+    def _cancel_after_first_round(xyz: NDArray[Shape["H, W, 3"], Float32]) -> None:
+        cancelled_progress.append(xyz)
+        cancel_event.set()
+
+    assert np.array_equal(
+        scene.plane_sweeping(
+            **coarse_to_fine,
+            progress_callback=_cancel_after_first_round,
+            cancel_event=cancel_event,
+        ),
+        progress[0],
+        equal_nan=True,
+    )
+    assert len(cancelled_progress) == 1
+
+    coarse_to_fine["coarse_to_fine_factor"] = 1
+    with pytest.raises(ValueError):
+        scene.plane_sweeping(**coarse_to_fine, time_budget=0.1)
+    with pytest.raises(ValueError):
+        scene.plane_sweeping(**coarse_to_fine, cancel_event=cancel_event)
+
+
+def test_plane_sweeping_with_camera_rig() -> None:
+    scene = _plane_sweeping_scene()
+    camera_rig = CameraRig.from_cameras(
+        lens_models=[scene.secondary_lens_model, scene.lens_model],
+        transformation_matrices=[scene.transformation_matrix, TransformationMatrix()],
+    )
+    height, width = scene.image.shape[:2]
+
+    assert np.allclose(
+        plane_sweeping_with_camera_rig(
+            images=[scene.secondary_image, scene.image],
+            camera_rig=camera_rig,
+            depth_range=np.array([80.0, 125.0], dtype=np.float32),
+            step_size=1.0,
+            block_size=5,
+            reference_camera=1,
+            rig=PlaneSweepingRig.from_camera_rig(
+                camera_rig=camera_rig, shape=(height, width), reference_camera=1
+            ),
+        ),
+        scene.plane_sweeping(),
+        atol=1e-3,
+        equal_nan=True,
+    )
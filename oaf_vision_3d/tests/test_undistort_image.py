@@ -0,0 +1,147 @@
+from pathlib import Path
+
+import cv2
+import numpy as np
+from matplotlib import pyplot as plt
+from scipy.ndimage import gaussian_filter, map_coordinates
+
+from oaf_vision_3d.lens_model import CameraMatrix, LensModel
+from oaf_vision_3d.undistort_image import (
+    FixedPointMap,
+    RemapFormat,
+    fixed_point_undistortion_map,
+    undistort_image_with_new_camera_matrix,
+    undistort_images_with_new_camera_matrix,
+)
+from test_data.data_paths import DataPaths
+
+
+def test_undistort_image_with_new_camera_matrix() -> None:
+    rng = np.random.default_rng(0)
+    image = gaussian_filter(
+        rng.random((302, 574, 3), dtype=np.float32), sigma=(2.0, 2.0, 0.0)
+    )
+    lens_model = LensModel.read_from_json(DataPaths.distorted_house_lens_model)
+    new_camera_matrix = CameraMatrix(fx=300.0, fy=300.0, cx=287.0, cy=151.0)
+
+    pixels = np.indices((302, 574), dtype=np.float32)[::-1].transpose(1, 2, 0)
+    distorted_pixels = lens_model.denormalize_pixels(
+        lens_model.distort_pixels((pixels - [287.0, 151.0]) / 300.0)
+    )
+    expected = np.stack(
+        [
+            map_coordinates(
+                input=_image,
+                coordinates=[distorted_pixels[..., 1], distorted_pixels[..., 0]],
+                order=1,
+            )
+            for _image in image.transpose(2, 0, 1)
+        ],
+        axis=-1,
+    )
+
+    assert np.allclose(
+        undistort_image_with_new_camera_matrix(
+            image=image, lens_model=lens_model, new_camera_matrix=new_camera_matrix
+        ),
+        expected,
+        atol=1e-5,
+    )
+
+    undistorted_image = undistort_image_with_new_camera_matrix(
+        image=image,
+        lens_model=lens_model,
+        new_camera_matrix=new_camera_matrix,
+        remap_format=RemapFormat.FIXED_POINT,
+    )
+    is_valid = (undistorted_image != 0) & (expected != 0)
+    assert is_valid.mean() > 0.9
+    assert np.allclose(undistorted_image[is_valid], expected[is_valid], atol=5e-3)
+
+
+def test_fixed_point_map() -> None:
+    rng = np.random.default_rng(0)
+    image = rng.random((20, 30), dtype=np.float32)
+    pixels = rng.uniform(0.0, 18.0, (5, 6, 2)).astype(np.float32)
+
+    fixed_point_map = FixedPointMap.from_pixels(pixels=pixels)
+    integer_pixels, interpolation_index = cv2.convertMaps(
+        pixels[..., 0], pixels[..., 1], cv2.CV_16SC2
+    )
+    assert np.array_equal(fixed_point_map.integer_pixels, integer_pixels)
+    assert np.array_equal(fixed_point_map.interpolation_index, interpolation_index)
+    assert np.allclose(
+        fixed_point_map.remap(image=image),
+        cv2.remap(image, integer_pixels, interpolation_index, cv2.INTER_LINEAR),
+        atol=1e-6,
+    )
+
+
+def test_fixed_point_undistortion_map() -> None:
+    lens_model = LensModel.read_from_json(DataPaths.distorted_house_lens_model)
+    new_camera_matrix = CameraMatrix(fx=300.0, fy=300.0, cx=287.0, cy=151.0)
+
+    fixed_point_map = fixed_point_undistortion_map(
+        lens_model=lens_model, shape=(302, 574), new_camera_matrix=new_camera_matrix
+    )
+    expected = FixedPointMap.from_lens_model(
+        lens_model=lens_model, shape=(302, 574), new_camera_matrix=new_camera_matrix
+    )
+    assert np.array_equal(fixed_point_map.integer_pixels, expected.integer_pixels)
+    assert np.array_equal(
+        fixed_point_map.interpolation_index, expected.interpolation_index
+    )
+    assert not fixed_point_map.integer_pixels.flags.writeable
+    assert not fixed_point_map.interpolation_index.flags.writeable
+
+    assert (
+        fixed_point_undistortion_map(
+            lens_model=LensModel.from_dict(lens_model.to_dict()),
+            shape=(302, 574),
+            new_camera_matrix=new_camera_matrix,
+        )
+        is fixed_point_map
+    )
+    assert (
+        fixed_point_undistortion_map(
+            lens_model=lens_model, shape=(300, 574), new_camera_matrix=new_camera_matrix
+        )
+        is not fixed_point_map
+    )
+
+
+def test_undistort_images_with_new_camera_matrix(tmp_path: Path) -> None:
+    rng = np.random.default_rng(0)
+    lens_model = LensModel.read_from_json(DataPaths.distorted_checkerboard_lens_model)
+    images = [
+        rng.random((100, 120, 3), dtype=np.float32),
+        rng.random((80, 60, 3), dtype=np.float32),
+        rng.random((100, 120, 3), dtype=np.float32),
+    ]
+    file_path = tmp_path / "image.png"
+    plt.imsave(file_path, images[0])
+    images.append(plt.imread(file_path))
+
+    for remap_format in RemapFormat:
+        expected = [
+            undistort_image_with_new_camera_matrix(
+                image=image,
+                lens_model=lens_model,
+                new_camera_matrix=lens_model.camera_matrix,
+                remap_format=remap_format,
+            )
+            for image in images
+        ]
+        undistorted_images = list(
+            undistort_images_with_new_camera_matrix(
+                images=[*images[:3], file_path],
+                lens_model=lens_model,
+                new_camera_matrix=lens_model.camera_matrix,
+                remap_format=remap_format,
+                workers=2,
+                prefetch=1,
+            )
+        )
+        assert len(undistorted_images) == len(expected)
+        for undistorted_image, _expected in zip(undistorted_images, expected):
+            assert np.array_equal(undistorted_image, _expected)
@@ -2,16 +2,310 @@
 # # Undistort Image
 #
 # This function undistorts an image using a new camera matrix as done in the
-# [workshop](../workshops/03_image_distortion_and_undistortion.ipynb).
+# [workshop](../workshops/03_image_distortion_and_undistortion.ipynb). Every pixel of
+# the new image is normalized with the new camera matrix, distorted and denormalized
+# into the original image, which is then sampled with bilinear interpolation. Pixels
+# that fall outside the original image are set to zero.
+#
+# With `RemapFormat.FLOAT32` the map is the cached
+# [undistortion map](lens_model.py) of the lens model, sampled with a
+# [bilinear warp](bilinear_warp.py). This gives the same result as the workshop.
+#
+# With `RemapFormat.FIXED_POINT` the map is stored the way `cv2.convertMaps` does it:
+# the integer pixel as `int16`, and the fractional part quantized to
+# `1 / 2**_INTERPOLATION_BITS` of a pixel as a `uint16` index into a table with the
+# four bilinear weights. This takes 6 bytes per pixel instead of 8, or 16 for `float64`
+# coordinates. Both the map and the image are processed in tiles of `_TILE_ROWS` rows,
+# so no full size floating point coordinates are ever created. The quantization
+# changes the result by up to `1 / 2**(_INTERPOLATION_BITS + 1)` of a pixel step.
+# Like the `float32` maps, `fixed_point_undistortion_map` keeps the fixed point maps
+# in a small LRU cache keyed by the lens model, the new camera matrix and the image
+# size, so undistorting frame after frame does not rebuild the map.
+#
+# `undistort_images_with_new_camera_matrix` undistorts a sequence of images, given as
+# arrays or as file paths, in a pool of `workers` threads. The map is computed once per
+# image size and shared by all threads, and the gathers release the GIL. Images are
+# read and undistorted ahead of the consumer, but at most `workers + prefetch` images
+# are in flight at any time, so the memory stays bounded for arbitrarily long
+# sequences. The results are yielded in the order of the input.
 
 # %%
-from nptyping import Float32, NDArray, Shape
+from __future__ import annotations
+
+from collections import OrderedDict, deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from enum import Enum
+from pathlib import Path
+from threading import Lock
+
+import numpy as np
+from matplotlib import pyplot as plt
+from nptyping import Bool, Float32, Int16, NDArray, Shape, UInt16
+
+from oaf_vision_3d.bilinear_warp import bilinear_warp
+from oaf_vision_3d.lens_model import (
+    CameraMatrix,
+    LensModel,
+    normalize_pixels,
+    undistortion_map_key,
+)
+
+_INTERPOLATION_BITS = 5
+_INTERPOLATION_SIZE = 1 << _INTERPOLATION_BITS
+_TILE_ROWS = 16
+_FIXED_POINT_MAP_CACHE_SIZE = 8
+
+
+class RemapFormat(Enum):
+    FLOAT32 = "float32"
+    FIXED_POINT = "fixed_point"
+
+
+def _interpolation_table() -> NDArray[Shape["4, N"], Float32]:
+    fraction = np.arange(_INTERPOLATION_SIZE, dtype=np.float32) / _INTERPOLATION_SIZE
+    fraction_y, fraction_x = (
+        _fraction.ravel()
+        for _fraction in np.meshgrid(fraction, fraction, indexing="ij")
+    )
+    return np.stack(
+        [
+            (1 - fraction_x) * (1 - fraction_y),
+            fraction_x * (1 - fraction_y),
+            (1 - fraction_x) * fraction_y,
+            fraction_x * fraction_y,
+        ]
+    )
+
+
+_INTERPOLATION_TABLE = _interpolation_table()
+
+
+@dataclass
+class FixedPointMap:
+    integer_pixels: NDArray[Shape["H, W, 2"], Int16]
+    interpolation_index: NDArray[Shape["H, W"], UInt16]
+
+    @staticmethod
+    def from_pixels(pixels: NDArray[Shape["H, W, 2"], Float32]) -> FixedPointMap:
+        limit = np.iinfo(np.int16).max
+        fixed_point = np.round(
+            np.clip(np.nan_to_num(pixels, nan=-1.0), -1.0, limit) * _INTERPOLATION_SIZE
+        ).astype(np.int32)
+        integer_pixels = fixed_point >> _INTERPOLATION_BITS
+        fraction = fixed_point & (_INTERPOLATION_SIZE - 1)
+        return FixedPointMap(
+            integer_pixels=integer_pixels.astype(np.int16),
+            interpolation_index=(
+                fraction[..., 1] * _INTERPOLATION_SIZE + fraction[..., 0]
+            ).astype(np.uint16),
+        )
+
+    @staticmethod
+    def from_lens_model(
+        lens_model: LensModel,
+        shape: tuple[int, int],
+        new_camera_matrix: CameraMatrix,
+    ) -> FixedPointMap:
+        fixed_point_map = FixedPointMap(
+            integer_pixels=np.empty((*shape, 2), dtype=np.int16),
+            interpolation_index=np.empty(shape, dtype=np.uint16),
+        )
+        for start in range(0, shape[0], _TILE_ROWS):
+            rows = np.arange(start, min(start + _TILE_ROWS, shape[0]), dtype=np.float32)
+            pixels = np.stack(
+                np.meshgrid(np.arange(shape[1], dtype=np.float32), rows), axis=-1
+            )
+            normalize_pixels(pixels, new_camera_matrix, out=pixels)
+            lens_model.distort_pixels(normalized_pixels=pixels, out=pixels)
+            lens_model.denormalize_pixels(pixels=pixels, out=pixels)
+            tile = FixedPointMap.from_pixels(pixels=pixels)
+            fixed_point_map.integer_pixels[start : start + _TILE_ROWS] = (
+                tile.integer_pixels
+            )
+            fixed_point_map.interpolation_index[start : start + _TILE_ROWS] = (
+                tile.interpolation_index
+            )
+        return fixed_point_map
+
+    def _is_inside(
+        self, start: int, stop: int, shape: tuple[int, int]
+    ) -> NDArray[Shape["R, W"], Bool]:
+        x = self.integer_pixels[start:stop, :, 0]
+        y = self.integer_pixels[start:stop, :, 1]
+        index = self.interpolation_index[start:stop]
+        return (
+            (x >= 0)
+            & (
+                (x < shape[1] - 1)
+                | ((x == shape[1] - 1) & (index % _INTERPOLATION_SIZE == 0))
+            )
+            & (y >= 0)
+            & (
+                (y < shape[0] - 1)
+                | ((y == shape[0] - 1) & (index < _INTERPOLATION_SIZE))
+            )
+        )
+
+    def remap(
+        self, image: NDArray[Shape["H, W, ..."], Float32]
+    ) -> NDArray[Shape["*, *, ..."], Float32]:
+        height, width = image.shape[:2]
+        channels = np.ascontiguousarray(
+            np.moveaxis(image.reshape(height, width, -1), -1, 0), dtype=np.float32
+        ).reshape(-1, height * width)
+        output_height, output_width = self.interpolation_index.shape
+        remapped = np.empty(
+            (channels.shape[0], output_height * output_width), dtype=np.float32
+        )
+        for start in range(0, output_height, _TILE_ROWS):
+            stop = min(start + _TILE_ROWS, output_height)
+            x = self.integer_pixels[start:stop, :, 0].ravel()
+            y = self.integer_pixels[start:stop, :, 1].ravel()
+            index = self.interpolation_index[start:stop].ravel()
+            is_inside = self._is_inside(
+                start=start, stop=stop, shape=(height, width)
+            ).ravel()
+
+            x_0 = np.clip(x, 0, width - 1).astype(np.intp)
+            x_1 = np.clip(x + 1, 0, width - 1).astype(np.intp)
+            y_0 = np.clip(y, 0, height - 1).astype(np.intp) * width
+            y_1 = np.clip(y + 1, 0, height - 1).astype(np.intp) * width
 
-from oaf_vision_3d.lens_model import CameraMatrix, LensModel
+            tile = remapped[:, start * output_width : stop * output_width]
+            np.take(channels, y_0 + x_0, axis=1, out=tile)
+            tile *= _INTERPOLATION_TABLE[0, index]
+            for weights, neighbour in zip(
+                _INTERPOLATION_TABLE[1:], [y_0 + x_1, y_1 + x_0, y_1 + x_1]
+            ):
+                values = np.take(channels, neighbour, axis=1)
+                values *= weights[index]
+                tile += values
+            tile[:, ~is_inside] = 0.0
+        return np.moveaxis(remapped, 0, -1).reshape(
+            output_height, output_width, *image.shape[2:]
+        )
 
 
-def undistort_image_with_new_camera_matrix(  # type: ignore
+_fixed_point_map_cache: OrderedDict[str, FixedPointMap] = OrderedDict()
+_fixed_point_map_cache_lock = Lock()
+
+
+def fixed_point_undistortion_map(
+    lens_model: LensModel,
+    shape: tuple[int, int],
+    new_camera_matrix: CameraMatrix,
+) -> FixedPointMap:
+    key = undistortion_map_key(
+        lens_model=lens_model, shape=shape, new_camera_matrix=new_camera_matrix
+    )
+    with _fixed_point_map_cache_lock:
+        if key in _fixed_point_map_cache:
+            _fixed_point_map_cache.move_to_end(key)
+            return _fixed_point_map_cache[key]
+
+    fixed_point_map = FixedPointMap.from_lens_model(
+        lens_model=lens_model, shape=shape, new_camera_matrix=new_camera_matrix
+    )
+    fixed_point_map.integer_pixels.setflags(write=False)
+    fixed_point_map.interpolation_index.setflags(write=False)
+
+    with _fixed_point_map_cache_lock:
+        _fixed_point_map_cache[key] = fixed_point_map
+        _fixed_point_map_cache.move_to_end(key)
+        while len(_fixed_point_map_cache) > _FIXED_POINT_MAP_CACHE_SIZE:
+            _fixed_point_map_cache.popitem(last=False)
+    return fixed_point_map
+
+
+def _remap(
+    lens_model: LensModel,
+    shape: tuple[int, int],
+    new_camera_matrix: CameraMatrix,
+    remap_format: RemapFormat,
+) -> NDArray[Shape["H, W, 2"], Float32] | FixedPointMap:
+    match remap_format:
+        case RemapFormat.FLOAT32:
+            return lens_model.undistortion_map(
+                shape=shape, new_camera_matrix=new_camera_matrix
+            )
+        case RemapFormat.FIXED_POINT:
+            return fixed_point_undistortion_map(
+                lens_model=lens_model, shape=shape, new_camera_matrix=new_camera_matrix
+            )
+        case _:
+            raise ValueError("Invalid remap format")
+
+
+def _remap_image(
+    image: NDArray[Shape["H, W, ..."], Float32],
+    remap: NDArray[Shape["H, W, 2"], Float32] | FixedPointMap,
+) -> NDArray[Shape["H, W, ..."], Float32]:
+    if isinstance(remap, FixedPointMap):
+        return remap.remap(image=image)
+    remapped_image = bilinear_warp(image=image, pixels=remap)
+    remapped_image[np.isnan(remapped_image)] = 0.0
+    return remapped_image
+
+
+def undistort_image_with_new_camera_matrix(
     image: NDArray[Shape["H, W, 3"], Float32],
     lens_model: LensModel,
     new_camera_matrix: CameraMatrix,
-) -> NDArray[Shape["H, W, 3"], Float32]: ...
+    remap_format: RemapFormat = RemapFormat.FLOAT32,
+) -> NDArray[Shape["H, W, 3"], Float32]:
+    height, width = image.shape[:2]
+    return _remap_image(
+        image=image,
+        remap=_remap(
+            lens_model=lens_model,
+            shape=(height, width),
+            new_camera_matrix=new_camera_matrix,
+            remap_format=remap_format,
+        ),
+    )
+
+
+def undistort_images_with_new_camera_matrix(
+    images: Iterable[NDArray[Shape["H, W, 3"], Float32] | Path],
+    lens_model: LensModel,
+    new_camera_matrix: CameraMatrix,
+    remap_format: RemapFormat = RemapFormat.FLOAT32,
+    workers: int = 4,
+    prefetch: int = 2,
+) -> Iterator[NDArray[Shape["H, W, 3"], Float32]]:
+    remaps: dict[
+        tuple[int, int], NDArray[Shape["H, W, 2"], Float32] | FixedPointMap
+    ] = {}
+    remaps_lock = Lock()
+
+    def _undistort(
+        image_or_path: NDArray[Shape["H, W, 3"], Float32] | Path,
+    ) -> NDArray[Shape["H, W, 3"], Float32]:
+        image: NDArray[Shape["H, W, 3"], Float32] = (
+            plt.imread(image_or_path)
+            if isinstance(image_or_path, Path)
+            else image_or_path
+        )
+        height, width = image.shape[:2]
+        shape = (int(height), int(width))
+        with remaps_lock:
+            if shape not in remaps:
+                remaps[shape] = _remap(
+                    lens_model=lens_model,
+                    shape=shape,
+                    new_camera_matrix=new_camera_matrix,
+                    remap_format=remap_format,
+                )
+            remap = remaps[shape]
+        return _remap_image(image=image, remap=remap)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending: deque[Future] = deque()
+        for image in images:
+            pending.append(executor.submit(_undistort, image))
+            if len(pending) >= workers + prefetch:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()